@@ -23,6 +23,10 @@ if [[ -n "$TA_UWSGI_PORT" ]]; then
     sed -i "s/8080/$TA_UWSGI_PORT/g" /app/uwsgi.ini
 fi
 
+if [[ -n "$TA_ASGI_PORT" ]]; then
+    sed -i "s/8081/$TA_ASGI_PORT/g" /etc/nginx/conf.d/nginx.conf
+fi
+
 # wait for elasticsearch
 counter=0
 until curl -u "$ELASTIC_USER":"$ELASTIC_PASSWORD" "$ES_URL" -fs; do
@@ -44,7 +48,35 @@ export DJANGO_SUPERUSER_PASSWORD=$TA_PASSWORD && \
 
 python manage.py collectstatic --noinput -c
 nginx &
-celery -A home.tasks worker --loglevel=INFO &
+
+# celery workers, one per task queue with TA_CELERY_SPLIT=true
+CELERY_QUEUES=(
+    "interactive:2"
+    "download:1"
+    "metadata:2"
+    "thumbnails:2"
+    "maintenance:1"
+)
+if [[ "$TA_CELERY_SPLIT" == "true" ]]; then
+    for each in "${CELERY_QUEUES[@]}"; do
+        queue="${each%%:*}"
+        concurrency_env="TA_CONCURRENCY_${queue^^}"
+        concurrency="${!concurrency_env:-${each##*:}}"
+        celery -A home.tasks worker --loglevel=INFO -Q "$queue" \
+            -n "$queue@%h" -c "$concurrency" --prefetch-multiplier 1 &
+    done
+else
+    all_queues=$(printf "%s," "${CELERY_QUEUES[@]%%:*}")
+    celery -A home.tasks worker --loglevel=INFO -Q "${all_queues%,}" &
+fi
+
+# optional live archive watcher
+if [[ "$TA_ARCHIVE_WATCHER" == "true" ]]; then
+    python manage.py watch_archive &
+fi
+
 celery -A home beat --loglevel=INFO \
     -s "${BEAT_SCHEDULE_PATH:-/cache/celerybeat-schedule}" &
+uvicorn config.asgi:application --port "${TA_ASGI_PORT:-8081}" \
+    --log-level warning &
 uwsgi --ini uwsgi.ini
@@ -2,6 +2,8 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Progress messages are streamed from here as server-sent events, everything
+else is handed over to django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -13,4 +15,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# pylint: disable=wrong-import-position
+from home.src.frontend.progress_stream import progress_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """route progress stream, pass on rest"""
+    if scope["type"] == "http" and scope["path"] == "/progress/stream/":
+        await progress_stream(scope, receive, send)
+        return
+
+    await django_application(scope, receive, send)
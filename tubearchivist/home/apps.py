@@ -3,7 +3,7 @@
 import os
 
 from django.apps import AppConfig
-from home.src.es.index_setup import index_check
+from home.src.es.index_setup import index_check_cached
 from home.src.ta.config import AppConfig as ArchivistConfig
 from home.src.ta.ta_redis import RedisArchivist
 
@@ -58,6 +58,6 @@ class HomeConfig(AppConfig):
 
     def ready(self):
         release_lock()
-        index_check()
+        index_check_cached()
         sync_redis_state()
         make_folders()
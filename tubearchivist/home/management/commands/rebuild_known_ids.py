@@ -0,0 +1,16 @@
+"""rebuild redis sets of known youtube ids"""
+
+from django.core.management.base import BaseCommand
+from home.src.download.known_ids import KnownIds
+
+
+class Command(BaseCommand):
+    """rebuild known ids from elastic search"""
+
+    help = "rebuild downloaded, pending and ignored youtube ids in redis"
+
+    def handle(self, *args, **options):
+        """rebuild and report counts"""
+        counts = KnownIds().rebuild()
+        for kind, count in counts.items():
+            self.stdout.write(f"{kind}: {count}")
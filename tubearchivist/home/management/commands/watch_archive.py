@@ -0,0 +1,14 @@
+"""start long running archive watcher"""
+
+from django.core.management.base import BaseCommand
+from home.src.index.watcher import ArchiveWatcher
+
+
+class Command(BaseCommand):
+    """watch archive for changed media files"""
+
+    help = "watch archive for changed media files and reconcile index"
+
+    def handle(self, *args, **options):
+        """run forever"""
+        ArchiveWatcher().run()
@@ -0,0 +1,128 @@
+"""
+functionality:
+- track youtube ids already downloaded, pending or ignored in redis
+- constant time membership check for subscription scans and queue adds
+- rebuild from elastic search
+"""
+
+from home.src.es.connect import IndexPaginate
+from home.src.ta.ta_redis import RedisArchivist
+
+
+class KnownIds:
+    """redis sets of youtube ids by state"""
+
+    KINDS = ["downloaded", "pending", "ignore"]
+    BUILT_KEY = "known:built"
+    CHUNK_SIZE = 1000
+
+    def __init__(self):
+        self.conn = RedisArchivist().redis_connection
+        self.name_space = RedisArchivist.NAME_SPACE
+
+    def _key(self, kind):
+        """redis key of set for kind"""
+        return f"{self.name_space}known:{kind}"
+
+    def add(self, youtube_ids, kind):
+        """add youtube_ids, pending and ignore are exclusive"""
+        if not youtube_ids:
+            return
+
+        pipeline = self.conn.pipeline(transaction=True)
+        if kind == "pending":
+            pipeline.execute_command("SREM", self._key("ignore"), *youtube_ids)
+        elif kind == "ignore":
+            pipeline.execute_command(
+                "SREM", self._key("pending"), *youtube_ids
+            )
+
+        pipeline.execute_command("SADD", self._key(kind), *youtube_ids)
+        pipeline.execute()
+
+    def remove(self, youtube_ids, kinds=False):
+        """remove youtube_ids from kinds, all kinds if not passed"""
+        if not youtube_ids:
+            return
+
+        pipeline = self.conn.pipeline(transaction=True)
+        for kind in kinds or self.KINDS:
+            pipeline.execute_command("SREM", self._key(kind), *youtube_ids)
+        pipeline.execute()
+
+    def clear(self, kind):
+        """remove all ids of kind"""
+        self.conn.execute_command("DEL", self._key(kind))
+
+    def filter_unknown(self, youtube_ids):
+        """get youtube_ids not downloaded, pending or ignored, keep order"""
+        self._ensure_built()
+        pipeline = self.conn.pipeline(transaction=False)
+        for youtube_id in youtube_ids:
+            for kind in self.KINDS:
+                pipeline.execute_command(
+                    "SISMEMBER", self._key(kind), youtube_id
+                )
+
+        reply = iter(pipeline.execute())
+        step = len(self.KINDS)
+        unknown = []
+        for youtube_id in youtube_ids:
+            is_member = [next(reply) for _ in range(step)]
+            if not any(is_member):
+                unknown.append(youtube_id)
+
+        return unknown
+
+    def is_known(self, youtube_id):
+        """check single youtube_id"""
+        return not self.filter_unknown([youtube_id])
+
+    def _ensure_built(self):
+        """build sets on first use"""
+        if not self.conn.execute_command("EXISTS", self._key_built()):
+            self.rebuild()
+
+    def invalidate(self):
+        """rebuild on next use, after index got replaced"""
+        self.conn.execute_command("DEL", self._key_built())
+
+    def _key_built(self):
+        """redis key marking sets as built"""
+        return self.name_space + self.BUILT_KEY
+
+    def rebuild(self):
+        """build all sets from indexed and queued videos"""
+        print("rebuild known youtube ids")
+        all_ids = {kind: [] for kind in self.KINDS}
+        data = {
+            "query": {"match_all": {}},
+            "_source": ["youtube_id"],
+            "sort": [{"_doc": {"order": "asc"}}],
+        }
+        all_videos = IndexPaginate("ta_video", data).get_results()
+        all_ids["downloaded"] = [i["youtube_id"] for i in all_videos]
+
+        data = {
+            "query": {"match_all": {}},
+            "_source": ["youtube_id", "status"],
+            "sort": [{"_doc": {"order": "asc"}}],
+        }
+        for video in IndexPaginate("ta_download", data).get_results():
+            if video["status"] in all_ids:
+                all_ids[video["status"]].append(video["youtube_id"])
+
+        pipeline = self.conn.pipeline(transaction=True)
+        for kind, youtube_ids in all_ids.items():
+            pipeline.execute_command("DEL", self._key(kind))
+            for idx in range(0, len(youtube_ids), self.CHUNK_SIZE):
+                end = idx + self.CHUNK_SIZE
+                chunk = youtube_ids[idx:end]
+                pipeline.execute_command("SADD", self._key(kind), *chunk)
+
+        pipeline.execute_command("SET", self._key_built(), 1)
+        pipeline.execute()
+
+        return {
+            kind: len(youtube_ids) for kind, youtube_ids in all_ids.items()
+        }
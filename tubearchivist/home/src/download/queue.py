@@ -2,22 +2,53 @@
 Functionality:
 - handle download queue
 - linked with ta_dowload index
+- aggregate progress of adding to queue in parallel chunks
 """
 
 import json
-import os
 from datetime import datetime
 
 import requests
-import yt_dlp
+from home.src.download.known_ids import KnownIds
 from home.src.download.subscriptions import ChannelSubscription
+from home.src.download.thumbnails import ThumbManager
 from home.src.es.connect import IndexPaginate
 from home.src.index.playlist import YoutubePlaylist
 from home.src.ta.config import AppConfig
-from home.src.ta.helper import DurationConverter, ignore_filelist
+from home.src.ta.helper import DurationConverter
+from home.src.ta.ratelimit import RateLimiter
 from home.src.ta.ta_redis import RedisArchivist
 
 
+class AddProgress:
+    """progress of adding to queue, shared by chunks of a batch"""
+
+    EXPIRE = 24 * 60 * 60
+
+    def __init__(self, batch_id):
+        self.conn = RedisArchivist().redis_connection
+        self.key = f"{RedisArchivist.NAME_SPACE}add:{batch_id}"
+
+    def start(self, total):
+        """set total videos of batch"""
+        pipeline = self.conn.pipeline()
+        pipeline.execute_command("HSET", self.key, "total", total, "done", 0)
+        pipeline.execute_command("EXPIRE", self.key, self.EXPIRE)
+        pipeline.execute()
+
+    def increment(self, count=1):
+        """mark count videos as processed, return done and total"""
+        pipeline = self.conn.pipeline()
+        pipeline.execute_command("HINCRBY", self.key, "done", count)
+        pipeline.execute_command("HGET", self.key, "total")
+        done, total = pipeline.execute()
+        return done, int(total or done)
+
+    def clear(self):
+        """batch finished"""
+        self.conn.execute_command("DEL", self.key)
+
+
 class PendingList:
     """manage the pending videos list"""
 
@@ -28,8 +59,9 @@ class PendingList:
 
     def __init__(self):
         self.all_channel_ids = False
-        self.all_downloaded = False
         self.missing_from_playlists = []
+        # AddProgress if processing chunk of larger batch
+        self.progress = False
 
     def parse_url_list(self, youtube_ids):
         """extract youtube ids from list"""
@@ -66,14 +98,22 @@ class PendingList:
 
     def add_to_pending(self, missing_videos, ignore=False):
         """build the bulk json data from pending"""
+        # check if already downloaded, queued or ignored
+        to_check = len(missing_videos)
+        missing_videos = KnownIds().filter_unknown(missing_videos)
+        if self.progress and len(missing_videos) < to_check:
+            self.progress.increment(to_check - len(missing_videos))
+        if not missing_videos:
+            return []
+
         # check if channel is indexed
         channel_handler = ChannelSubscription()
         all_indexed = channel_handler.get_channels(subscribed_only=False)
         self.all_channel_ids = [i["channel_id"] for i in all_indexed]
-        # check if already there
-        self.all_downloaded = self.get_all_downloaded()
-
         bulk_list, all_videos_added = self.build_bulk(missing_videos, ignore)
+        if not all_videos_added:
+            return []
+
         # add last newline
         bulk_list.append("\n")
         query_str = "\n".join(bulk_list)
@@ -86,6 +126,10 @@ class PendingList:
             print(request)
             raise ValueError("failed to add video to download queue")
 
+        all_ids = [i[0] for i in all_videos_added]
+        KnownIds().add(all_ids, "ignore" if ignore else "pending")
+        ThumbManager.track_added(all_ids)
+
         return all_videos_added
 
     def build_bulk(self, missing_videos, ignore=False):
@@ -94,11 +138,8 @@ class PendingList:
         all_videos_added = []
 
         for idx, youtube_id in enumerate(missing_videos):
-            # check if already downloaded
-            if youtube_id in self.all_downloaded:
-                continue
-
             video = self.get_youtube_details(youtube_id)
+            self._notify_add(idx, len(missing_videos))
             # skip on download error
             if not video:
                 continue
@@ -113,25 +154,30 @@ class PendingList:
             bulk_list.append(json.dumps(action))
             bulk_list.append(json.dumps(video))
             all_videos_added.append((youtube_id, video["vid_thumb_url"]))
-            # notify
-            progress = f"{idx + 1}/{len(missing_videos)}"
-            mess_dict = {
-                "status": "message:add",
-                "level": "info",
-                "title": "Adding new videos to download queue.",
-                "message": "Progress: " + progress,
-            }
-            if idx + 1 == len(missing_videos):
-                RedisArchivist().set_message(
-                    "message:add", mess_dict, expire=4
-                )
-            else:
-                RedisArchivist().set_message("message:add", mess_dict)
-            if idx + 1 % 25 == 0:
-                print("adding to queue progress: " + progress)
 
         return bulk_list, all_videos_added
 
+    def _notify_add(self, idx, total):
+        """send progress, aggregated over all chunks of batch"""
+        if self.progress:
+            done, total = self.progress.increment()
+        else:
+            done = idx + 1
+
+        progress = f"{done}/{total}"
+        mess_dict = {
+            "status": "message:add",
+            "level": "info",
+            "title": "Adding new videos to download queue.",
+            "message": "Progress: " + progress,
+        }
+        if done >= total:
+            RedisArchivist().set_message("message:add", mess_dict, expire=4)
+        else:
+            RedisArchivist().set_message("message:add", mess_dict)
+        if done % 25 == 0:
+            print("adding to queue progress: " + progress)
+
     @staticmethod
     def get_youtube_details(youtube_id):
         """get details from youtubedl for single pending video"""
@@ -143,6 +189,9 @@ class PendingList:
             "writethumbnail": True,
             "simulate": True,
         }
+        import yt_dlp
+
+        RateLimiter("yt_extract").acquire()
         try:
             vid = yt_dlp.YoutubeDL(obs).extract_info(youtube_id)
         except yt_dlp.utils.DownloadError:
@@ -204,26 +253,16 @@ class PendingList:
 
         return all_indexed
 
-    def get_all_downloaded(self):
-        """get a list of all videos in archive"""
-        channel_folders = os.listdir(self.VIDEOS)
-        all_channel_folders = ignore_filelist(channel_folders)
-        all_downloaded = []
-        for channel_folder in all_channel_folders:
-            channel_path = os.path.join(self.VIDEOS, channel_folder)
-            videos = os.listdir(channel_path)
-            all_videos = ignore_filelist(videos)
-            youtube_vids = [i[9:20] for i in all_videos]
-            for youtube_id in youtube_vids:
-                all_downloaded.append(youtube_id)
-        return all_downloaded
-
     def delete_from_pending(self, youtube_id):
         """delete the youtube_id from ta_download"""
         url = f"{self.ES_URL}/ta_download/_doc/{youtube_id}"
         response = requests.delete(url, auth=self.ES_AUTH)
         if not response.ok:
             print(response.text)
+            return
+
+        KnownIds().remove([youtube_id], kinds=["pending", "ignore"])
+        ThumbManager.track_deleted([youtube_id])
 
     def delete_pending(self, status):
         """delete download queue based on status value"""
@@ -236,6 +275,10 @@ class PendingList:
         )
         if not response.ok:
             print(response.text)
+            return
+
+        KnownIds().clear(status)
+        ThumbManager.request_rescan()
 
     def ignore_from_pending(self, ignore_list):
         """build the bulk query string"""
@@ -261,3 +304,5 @@ class PendingList:
         if not request.ok:
             print(request)
             raise ValueError("failed to set video to ignore")
+
+        KnownIds().add(ignore_list, "ignore")
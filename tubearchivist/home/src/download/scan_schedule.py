@@ -0,0 +1,165 @@
+"""
+functionality:
+- schedule subscribed channel scans individually by upload cadence
+- keep due channels in a redis sorted set, check them in small batches
+- back off exponentially for channels without new uploads
+"""
+
+import json
+import os
+import random
+from time import time
+
+from home.src.download.queue import PendingList
+from home.src.download.subscriptions import ChannelSubscription
+from home.src.download.thumbnails import ThumbManager
+from home.src.ta.ta_redis import RedisArchivist
+
+
+class ChannelScanSchedule:
+    """per channel next check time, trickled through the day"""
+
+    ENABLED = os.environ.get("TA_ADAPTIVE_SCAN") == "true"
+    # minutes between checks for due channels
+    TICK = 10
+    BATCH_SIZE = 50
+    DUE_KEY = "scan:due"
+    STATE_KEY = "scan:state"
+    # assumed upload interval before the first observation
+    DEFAULT_INTERVAL = 24 * 60 * 60
+    MIN_DELAY = 60 * 60
+    MAX_DELAY = 14 * 24 * 60 * 60
+    # weight of the latest observation in the interval estimate
+    SMOOTHING = 0.3
+    JITTER = 0.1
+
+    def __init__(self):
+        self.conn = RedisArchivist().redis_connection
+        self.name_space = RedisArchivist.NAME_SPACE
+
+    def _key(self, key):
+        """redis key in name space"""
+        return self.name_space + key
+
+    def sync(self, all_channel_ids, now=False):
+        """schedule new subscriptions, remove unsubscribed channels
+        spread over the default interval on first run to avoid a burst
+        """
+        now = now or time()
+        scheduled = self.conn.execute_command(
+            "ZRANGE", self._key(self.DUE_KEY), 0, -1
+        )
+        scheduled = {i.decode() for i in scheduled}
+        to_remove = scheduled - set(all_channel_ids)
+        to_add = [i for i in all_channel_ids if i not in scheduled]
+
+        spread = 0 if scheduled else self.DEFAULT_INTERVAL
+        pipeline = self.conn.pipeline()
+        if to_remove:
+            pipeline.execute_command(
+                "ZREM", self._key(self.DUE_KEY), *to_remove
+            )
+            pipeline.execute_command(
+                "HDEL", self._key(self.STATE_KEY), *to_remove
+            )
+        for channel_id in to_add:
+            due = now + random.uniform(0, spread)
+            pipeline.execute_command(
+                "ZADD", self._key(self.DUE_KEY), "NX", due, channel_id
+            )
+        pipeline.execute()
+
+    def get_due(self, now=False):
+        """get batch of channels due for scan, oldest first"""
+        now = now or time()
+        due = self.conn.execute_command(
+            "ZRANGEBYSCORE",
+            self._key(self.DUE_KEY),
+            "-inf",
+            now,
+            "LIMIT",
+            0,
+            self.BATCH_SIZE,
+        )
+        return [i.decode() for i in due]
+
+    def reschedule(self, scan_counts, now=False):
+        """update interval estimate and next check from scan results
+        scan_counts is dict of channel_id: count of new videos or False
+        """
+        if not scan_counts:
+            return
+
+        now = now or time()
+        all_ids = list(scan_counts)
+        reply = self.conn.execute_command(
+            "HMGET", self._key(self.STATE_KEY), *all_ids
+        )
+
+        pipeline = self.conn.pipeline()
+        for channel_id, state_json in zip(all_ids, reply):
+            state = json.loads(state_json) if state_json else {}
+            new_count = scan_counts[channel_id]
+            if new_count is False:
+                # failed scan, retry soon without changing estimate
+                delay = self.MIN_DELAY
+            else:
+                state = self.update_state(state, new_count, now)
+                delay = self.get_delay(state)
+                pipeline.execute_command(
+                    "HSET",
+                    self._key(self.STATE_KEY),
+                    channel_id,
+                    json.dumps(state),
+                )
+
+            pipeline.execute_command(
+                "ZADD", self._key(self.DUE_KEY), now + delay, channel_id
+            )
+        pipeline.execute()
+
+    def update_state(self, state, new_count, now):
+        """fold observation of new_count videos since last check into state"""
+        interval = state.get("interval", self.DEFAULT_INTERVAL)
+        misses = state.get("misses", 0)
+        last_checked = state.get("checked")
+        if last_checked:
+            elapsed = now - last_checked
+            if new_count:
+                observed = elapsed / new_count
+                misses = 0
+            else:
+                # no upload for at least elapsed
+                observed = max(interval, elapsed)
+                misses += 1
+
+            interval = (
+                self.SMOOTHING * observed + (1 - self.SMOOTHING) * interval
+            )
+
+        return {"interval": interval, "misses": misses, "checked": now}
+
+    def get_delay(self, state):
+        """check twice per upload interval, double with every miss"""
+        delay = state["interval"] / 2 * 2 ** min(state["misses"], 16)
+        delay *= random.uniform(1 - self.JITTER, 1 + self.JITTER)
+        return min(max(delay, self.MIN_DELAY), self.MAX_DELAY)
+
+    def run(self):
+        """scan due channels and add new videos to download queue"""
+        handler = ChannelSubscription()
+        all_channels = handler.get_channels()
+        self.sync([i["channel_id"] for i in all_channels])
+        due = set(self.get_due())
+        if not due:
+            return
+
+        print(f"adaptive scan: {len(due)} channels due")
+        due_channels = [i for i in all_channels if i["channel_id"] in due]
+        missing = handler.find_missing(all_channels=due_channels)
+        if missing:
+            all_videos_added = PendingList().add_to_pending(missing)
+            ThumbManager().download_vid(all_videos_added)
+
+        handler.set_last_seen()
+        self.reschedule(handler.scan_counts)
@@ -2,25 +2,78 @@
 Functionality:
 - handle channel subscriptions
 - handle playlist subscriptions
+- scan subscriptions concurrently, isolate failures
+- scan channels incrementally up to last seen videos
 """
 
-import yt_dlp
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from home.src.download import queue  # partial import
+from home.src.download.known_ids import KnownIds
 from home.src.es.connect import IndexPaginate
 from home.src.index.channel import YoutubeChannel
 from home.src.index.playlist import YoutubePlaylist
 from home.src.ta.config import AppConfig
+from home.src.ta.ratelimit import RateLimiter
 from home.src.ta.ta_redis import RedisArchivist
 
+SCAN_WORKERS = int(os.environ.get("TA_SCAN_WORKERS") or 4)
+
+
+def scan_concurrent(all_items, scan_item, title):
+    """call scan_item for all_items in parallel, results in order of items
+    requests to youtube stay within the shared rate limit,
+    failing items are logged and return False
+    """
+    results = [False] * len(all_items)
+    if not all_items:
+        return results
+
+    with ThreadPoolExecutor(SCAN_WORKERS) as pool:
+        futures = {
+            pool.submit(scan_item, item): idx
+            for idx, item in enumerate(all_items)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except Exception as err:  # pylint: disable=broad-except
+                print(f"{all_items[idx]}: failed to scan, skipping: {err}")
+
+            message = {
+                "status": "message:rescan",
+                "level": "info",
+                "title": title,
+                "message": f"Progress: {done}/{len(all_items)}",
+            }
+            expire = 4 if done == len(all_items) else True
+            RedisArchivist().set_message(
+                "message:rescan", message=message, expire=expire
+            )
+
+    return results
+
 
 class ChannelSubscription:
     """manage the list of channels subscribed"""
 
+    # videos requested first for channels scanned before
+    FIRST_PAGE = 5
+    # newest video ids stored as high-water mark, survives some deletions
+    LAST_SEEN_SIZE = 5
+    LAST_SEEN_KEY = "scan:last_seen"
+
     def __init__(self):
         config = AppConfig().config
         self.es_url = config["application"]["es_url"]
         self.es_auth = config["application"]["es_auth"]
         self.channel_size = config["subscriptions"]["channel_size"]
+        self.last_seen = {}
+        self.scanned = {}
+        self.scan_counts = {}
 
     @staticmethod
     def get_channels(subscribed_only=True):
@@ -38,7 +91,9 @@ class ChannelSubscription:
         return all_channels
 
     def get_last_youtube_videos(self, channel_id, limit=True):
-        """get a list of last videos from channel"""
+        """get a list of last videos from channel
+        limit to channel_size if True, to number of videos if int
+        """
         url = f"https://www.youtube.com/channel/{channel_id}/videos"
         obs = {
             "default_search": "ytsearch",
@@ -46,9 +101,14 @@ class ChannelSubscription:
             "skip_download": True,
             "extract_flat": True,
         }
+        if limit is True:
+            limit = self.channel_size
         if limit:
-            obs["playlistend"] = self.channel_size
+            obs["playlistend"] = limit
 
+        import yt_dlp
+
+        RateLimiter("yt_extract").acquire()
         try:
             chan = yt_dlp.YoutubeDL(obs).extract_info(url, download=False)
         except yt_dlp.utils.DownloadError:
@@ -58,41 +118,123 @@ class ChannelSubscription:
         last_videos = [(i["id"], i["title"]) for i in chan["entries"]]
         return last_videos
 
-    def find_missing(self):
-        """add missing videos from subscribed channels to pending"""
-        all_channels = self.get_channels()
-        pending_handler = queue.PendingList()
-        all_pending, all_ignore = pending_handler.get_all_pending()
-        all_ids = [i["youtube_id"] for i in all_ignore + all_pending]
-        all_downloaded = pending_handler.get_all_downloaded()
-        to_ignore = all_ids + all_downloaded
-
-        missing_videos = []
-
-        for idx, channel in enumerate(all_channels):
-            channel_id = channel["channel_id"]
-            last_videos = self.get_last_youtube_videos(channel_id)
-
-            if last_videos:
-                for video in last_videos:
-                    if video[0] not in to_ignore:
-                        missing_videos.append(video[0])
-            # notify
-            message = {
-                "status": "message:rescan",
-                "level": "info",
-                "title": "Scanning channels: Looking for new videos.",
-                "message": f"Progress: {idx + 1}/{len(all_channels)}",
-            }
-            if idx + 1 == len(all_channels):
-                RedisArchivist().set_message(
-                    "message:rescan", message=message, expire=4
-                )
-            else:
-                RedisArchivist().set_message("message:rescan", message=message)
+    def find_missing(self, all_channels=False):
+        """add missing videos from subscribed channels to pending
+        scan all_channels if passed, else all subscribed channels
+        call set_last_seen after adding to pending to store progress
+        """
+        all_channels = all_channels or self.get_channels()
+        all_channel_ids = [i["channel_id"] for i in all_channels]
+        self.last_seen = self.get_last_seen(all_channel_ids)
+        all_results = scan_concurrent(
+            all_channel_ids,
+            self.get_new_videos,
+            "Scanning channels: Looking for new videos.",
+        )
+        last_ids = []
+        for channel_id, last_videos in zip(all_channel_ids, all_results):
+            if last_videos is False:
+                self.scan_counts[channel_id] = False
+                continue
 
+            self.scan_counts[channel_id] = len(last_videos)
+            last_ids.extend([i[0] for i in last_videos])
+
+        unique_ids = list(dict.fromkeys(last_ids))
+        missing_videos = KnownIds().filter_unknown(unique_ids)
         return missing_videos
 
+    def get_new_videos(self, channel_id):
+        """get videos uploaded since last scan
+        start with a small page, widen only if all videos on it are new
+        """
+        last_seen = self.last_seen.get(channel_id)
+        page_sizes = [self.channel_size]
+        if last_seen:
+            # widen straight to channel_size, every request starts over
+            page_sizes.insert(0, min(self.FIRST_PAGE, self.channel_size))
+
+        for page_size in page_sizes:
+            last_videos = self.get_last_youtube_videos(
+                channel_id, limit=page_size
+            )
+            if not last_videos:
+                return last_videos
+
+            new_videos = self._until_last_seen(last_videos, last_seen)
+            reached_mark = len(new_videos) < len(last_videos)
+            at_end = len(last_videos) < page_size
+            if reached_mark or at_end or page_size >= self.channel_size:
+                break
+
+        # mark set after adding to pending, see set_last_seen
+        page_ids = [i[0] for i in last_videos]
+        self.scanned[channel_id] = (page_ids, len(new_videos))
+
+        return new_videos
+
+    @staticmethod
+    def _until_last_seen(last_videos, last_seen):
+        """get videos newer than first video of last_seen found"""
+        if not last_seen:
+            return last_videos
+
+        for idx, video in enumerate(last_videos):
+            if video[0] in last_seen:
+                return last_videos[:idx]
+
+        return last_videos
+
+    def get_last_seen(self, all_channel_ids):
+        """get dict of channel_id: high-water mark from last scan"""
+        if not all_channel_ids:
+            return {}
+
+        reply = RedisArchivist().redis_connection.execute_command(
+            "HMGET",
+            RedisArchivist.NAME_SPACE + self.LAST_SEEN_KEY,
+            *all_channel_ids,
+        )
+        last_seen = {
+            channel_id: json.loads(mark) if mark else []
+            for channel_id, mark in zip(all_channel_ids, reply)
+        }
+        return last_seen
+
+    def set_last_seen(self):
+        """store high-water mark of channels changed in last scan
+        mark stops before new videos not added to pending, like live
+        streams or upcoming premieres, to pick them up on next scan
+        """
+        all_new_ids = []
+        for page_ids, new_count in self.scanned.values():
+            all_new_ids.extend(page_ids[:new_count])
+
+        skipped = set(KnownIds().filter_unknown(all_new_ids))
+        all_marks = []
+        for channel_id, (page_ids, new_count) in self.scanned.items():
+            new_mark = self._build_mark(page_ids, new_count, skipped)
+            if new_mark and new_mark != self.last_seen.get(channel_id):
+                all_marks.extend([channel_id, json.dumps(new_mark)])
+
+        self.scanned = {}
+        if not all_marks:
+            return
+
+        RedisArchivist().redis_connection.execute_command(
+            "HSET", RedisArchivist.NAME_SPACE + self.LAST_SEEN_KEY, *all_marks
+        )
+
+    def _build_mark(self, page_ids, new_count, skipped):
+        """newest ids of page older than the oldest skipped new video"""
+        start = 0
+        for idx, youtube_id in enumerate(page_ids[:new_count]):
+            if youtube_id in skipped:
+                start = idx + 1
+
+        end = start + self.LAST_SEEN_SIZE
+        return page_ids[start:end]
+
     @staticmethod
     def change_subscribe(channel_id, channel_subscribed):
         """subscribe or unsubscribe from channel and update"""
@@ -132,7 +274,6 @@ class PlaylistSubscription:
         all_indexed = queue.PendingList().get_all_indexed()
         all_youtube_ids = [i["youtube_id"] for i in all_indexed]
 
-        new_thumbs = []
         for idx, playlist in enumerate(new_playlists):
             url_type = playlist["type"]
             playlist_id = playlist["url"]
@@ -147,8 +288,7 @@ class PlaylistSubscription:
             playlist_h.upload_to_es()
             playlist_h.add_vids_to_playlist()
             self.channel_validate(playlist_h.json_data["playlist_channel_id"])
-            thumb = playlist_h.json_data["playlist_thumbnail"]
-            new_thumbs.append((playlist_id, thumb))
+            playlist_h.queue_playlist_art()
             # notify
             message = {
                 "status": "message:subplaylist",
@@ -160,8 +300,6 @@ class PlaylistSubscription:
                 "message:subplaylist", message=message
             )
 
-        return new_thumbs
-
     @staticmethod
     def channel_validate(channel_id):
         """make sure channel of playlist is there"""
@@ -171,52 +309,44 @@ class PlaylistSubscription:
     @staticmethod
     def change_subscribe(playlist_id, subscribe_status):
         """change the subscribe status of a playlist"""
+        from home.tasks import download_playlist_art  # circular import
+
         playlist = YoutubePlaylist(playlist_id)
         playlist.build_json()
         playlist.json_data["playlist_subscribed"] = subscribe_status
         playlist.upload_to_es()
-
-    @staticmethod
-    def get_to_ignore():
-        """get all youtube_ids already downloaded or ignored"""
-        pending_handler = queue.PendingList()
-        all_pending, all_ignore = pending_handler.get_all_pending()
-        all_ids = [i["youtube_id"] for i in all_ignore + all_pending]
-        all_downloaded = pending_handler.get_all_downloaded()
-        to_ignore = all_ids + all_downloaded
-        return to_ignore
+        # artwork of new playlist got queued by build_json
+        download_playlist_art.delay()
 
     def find_missing(self):
         """find videos in subscribed playlists not downloaded yet"""
         all_playlists = [i["playlist_id"] for i in self.get_playlists()]
-        to_ignore = self.get_to_ignore()
-
-        missing_videos = []
-        for idx, playlist_id in enumerate(all_playlists):
-            size_limit = self.config["subscriptions"]["channel_size"]
-            playlist = YoutubePlaylist(playlist_id)
-            playlist.update_playlist()
-            if not playlist:
-                playlist.deactivate()
-                continue
-
-            playlist_entries = playlist.json_data["playlist_entries"]
-            if size_limit:
-                del playlist_entries[size_limit:]
-
-            all_missing = [i for i in playlist_entries if not i["downloaded"]]
+        all_results = scan_concurrent(
+            all_playlists,
+            self._scan_playlist,
+            "Scanning playlists: Looking for new videos.",
+        )
+        all_missing_ids = []
+        for playlist_missing in all_results:
+            if playlist_missing:
+                all_missing_ids.extend(playlist_missing)
+
+        unique_ids = list(dict.fromkeys(all_missing_ids))
+        missing_videos = KnownIds().filter_unknown(unique_ids)
+        return missing_videos
 
-            message = {
-                "status": "message:rescan",
-                "level": "info",
-                "title": "Scanning playlists: Looking for new videos.",
-                "message": f"Progress: {idx + 1}/{len(all_playlists)}",
-            }
-            RedisArchivist().set_message("message:rescan", message=message)
+    def _scan_playlist(self, playlist_id):
+        """update single playlist, get ids of videos not downloaded"""
+        size_limit = self.config["subscriptions"]["channel_size"]
+        playlist = YoutubePlaylist(playlist_id)
+        if not playlist.update_playlist():
+            playlist.deactivate()
+            return False
 
-            for video in all_missing:
-                youtube_id = video["youtube_id"]
-                if youtube_id not in to_ignore:
-                    missing_videos.append(youtube_id)
+        playlist_entries = playlist.json_data["playlist_entries"]
+        if size_limit:
+            del playlist_entries[size_limit:]
 
-        return missing_videos
+        return [
+            i["youtube_id"] for i in playlist_entries if not i["downloaded"]
+        ]
@@ -2,20 +2,213 @@
 functionality:
 - handle download and caching for thumbnails
 - check for missing thumbnails
+- track added and deleted videos for incremental validation
+- build resized webp variants and lqip placeholders for grid views
+- embed thumbnails into media files
+- migrate between video thumbnail folder layouts
+- fetch thumbnails missing in cache on request
 """
 
+import base64
+import hashlib
+import json
 import os
+import re
+import shutil
+import tempfile
+import threading
 from collections import Counter
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import sleep, time
 
 import requests
-from home.src.download import queue  # partial import
 from home.src.download import subscriptions  # partial import
+from home.src.es.connect import ElasticWrap, IndexPaginate
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import ignore_filelist
-from home.src.ta.ta_redis import RedisArchivist
-from mutagen.mp4 import MP4, MP4Cover
-from PIL import Image
+from home.src.ta.ratelimit import RateLimiter
+from home.src.ta.ta_redis import RedisArchivist, RedisSet
+
+
+class ThumbFetcher:
+    """fetch images concurrently over pooled keep-alive sessions
+    network io and image processing run in separate thread pools
+    """
+
+    FETCH_WORKERS = 8
+    PROCESS_WORKERS = os.cpu_count() or 2
+    CHUNK_SIZE = 64
+    RETRIES = 3
+    BACKOFF = 2
+    NOTIFY_INTERVAL = 1
+
+    def __init__(self, notify=False):
+        self.notify = notify
+        self.local = threading.local()
+        self.last_notify = 0
+
+    def _get_session(self):
+        """reuse one session per thread to keep connections alive"""
+        session = getattr(self.local, "session", False)
+        if not session:
+            session = requests.Session()
+            self.local.session = session
+
+        return session
+
+    def fetch(self, img_url):
+        """get image bytes, False on 404 or failure"""
+        img_bytes, _ = self.fetch_meta(img_url)
+        return img_bytes
+
+    def fetch_meta(self, img_url, cached=False):
+        """get image bytes and validators, retry with backoff
+        conditional request if cached meta is passed, None if not modified
+        """
+        if not img_url:
+            return False, False
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        for attempt in range(self.RETRIES):
+            RateLimiter("thumbnail").acquire()
+            try:
+                response = self._get_session().get(
+                    img_url, headers=headers, timeout=10
+                )
+            except requests.exceptions.RequestException:
+                response = False
+
+            if response is not False:
+                if response.status_code == 304:
+                    return None, cached
+                if response.ok:
+                    return response.content, self._get_meta(img_url, response)
+                if response.status_code == 404:
+                    return False, False
+
+            if attempt + 1 < self.RETRIES:
+                print("retry thumbnail download for " + img_url)
+                sleep(self.BACKOFF * 2**attempt)
+
+        print("failed to download thumbnail " + img_url)
+        return False, False
+
+    @staticmethod
+    def _get_meta(img_url, response):
+        """extract validators for next conditional request"""
+        meta = {
+            "url": img_url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "hash": content_hash(response.content),
+        }
+        return meta
+
+    def run(self, jobs, processor):
+        """fetch url of all jobs, pass bytes on to processor(job, bytes)
+        processing of one chunk overlaps with fetching the next chunk
+        """
+        total = len(jobs)
+        done = 0
+        pending = []
+        with ThreadPoolExecutor(self.FETCH_WORKERS) as fetch_pool:
+            with ThreadPoolExecutor(self.PROCESS_WORKERS) as process_pool:
+                for start in range(0, total, self.CHUNK_SIZE):
+                    end = start + self.CHUNK_SIZE
+                    chunk = jobs[start:end]
+                    all_fetched = fetch_pool.map(
+                        self.fetch_meta, [i["url"] for i in chunk]
+                    )
+                    next_pending = []
+                    for job, (img_bytes, meta) in zip(chunk, all_fetched):
+                        job["meta"] = meta
+                        next_pending.append(
+                            process_pool.submit(processor, job, img_bytes)
+                        )
+                    done = self._wait(pending, done, total)
+                    pending = next_pending
+
+                self._wait(pending, done, total)
+
+    def _wait(self, pending, done, total):
+        """wait for processing futures to finish"""
+        for future in pending:
+            future.result()
+            done = done + 1
+            self._progress(done, total)
+
+        return done
+
+    def _progress(self, done, total):
+        """coalesce progress notifications"""
+        if not self.notify:
+            return
+
+        now = time()
+        if done == total or now - self.last_notify >= self.NOTIFY_INTERVAL:
+            self.last_notify = now
+            self.notify(done, total)
+
+
+class ThumbLayout:
+    """folder layout of cached video thumbnails
+    state file in video cache tracks active layout and migration target
+    """
+
+    LAYOUTS = ["char", "hash"]
+    STATE_FILE = ".layout"
+
+    def __init__(self, video_dir, configured="char"):
+        self.video_dir = video_dir
+        self.configured = configured
+        self.state_path = os.path.join(video_dir, self.STATE_FILE)
+
+    def get_state(self):
+        """read layout state, start empty cache in configured layout
+        existing cache without state file is in first character layout,
+        state file written once to skip the cache walk from then on
+        """
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            layout = self.configured if self._is_empty() else "char"
+            os.makedirs(self.video_dir, exist_ok=True)
+            self.set_state(layout)
+            state = {"layout": layout, "target": False}
+
+        return state
+
+    def _is_empty(self):
+        """check if there are no cached files yet"""
+        for _, _, all_files in os.walk(self.video_dir):
+            if ignore_filelist(all_files):
+                return False
+
+        return True
+
+    def set_state(self, layout, target=False):
+        """atomically write new layout state"""
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"layout": layout, "target": target}, f)
+
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def get_folder(youtube_id, layout):
+        """relative folder of youtube_id in layout"""
+        if layout == "hash":
+            digest = hashlib.md5(youtube_id.encode()).hexdigest()
+            return os.path.join(digest[:2], digest[2:4])
+
+        return youtube_id[0].lower()
 
 
 class ThumbManager:
@@ -28,57 +221,102 @@ class ThumbManager:
     CHANNEL_DIR = os.path.join(CACHE_DIR, "channels")
     PLAYLIST_DIR = os.path.join(CACHE_DIR, "playlists")
 
-    def get_all_thumbs(self):
-        """get all video artwork already downloaded"""
-        all_thumb_folders = ignore_filelist(os.listdir(self.VIDEO_DIR))
-        all_thumbs = []
-        for folder in all_thumb_folders:
-            folder_path = os.path.join(self.VIDEO_DIR, folder)
-            if os.path.isfile(folder_path):
-                self.update_path(folder)
-                all_thumbs.append(folder_path)
-                continue
-                # raise exemption here in a future version
-                # raise FileExistsError("video cache dir has files inside")
+    ADDED_KEY = "thumb:added"
+    DELETED_KEY = "thumb:deleted"
+    RESCAN_KEY = "thumb:rescan"
+    VARIANT_WIDTHS = [320, 640]
+    LQIP_SIZE = (16, 9)
+    EMBED_CHECKPOINT = "thumb:embedded"
+    META_KEY = "thumb:meta"
+    EMBED_WORKERS = int(os.environ.get("TA_EMBED_WORKERS") or 4)
+    MIGRATE_CHECKPOINT = "thumb:layout_migrated"
+    PLAYLIST_QUEUE = "thumb:playlist_queue"
+    MISSING_KEY = "thumb:missing"
+    # seconds before the same missing thumbnail can be requested again
+    MISSING_RETRY = 60 * 60
+    # seconds to batch requests into one fetch task
+    MISSING_BATCH = 2
+    CHANNEL_QUEUE = "thumb:channel_queue"
+
+    def __init__(self):
+        self.layout = ThumbLayout(
+            self.VIDEO_DIR,
+            configured=self.CONFIG["application"].get("thumb_layout", "char"),
+        )
+        self.state = self.layout.get_state()
 
+    def get_all_thumbs(self):
+        """get set of all video artwork already downloaded"""
+        all_thumbs = set()
+        for folder_path in self.get_thumb_folders(self.state["layout"]):
             all_folder_thumbs = ignore_filelist(os.listdir(folder_path))
-            all_thumbs.extend(all_folder_thumbs)
+            all_thumbs.update(all_folder_thumbs)
 
         return all_thumbs
 
+    def get_thumb_folders(self, layout):
+        """get all folders holding video thumbnails in layout"""
+        all_entries = ignore_filelist(os.listdir(self.VIDEO_DIR))
+        for file_name in all_entries:
+            if os.path.isfile(os.path.join(self.VIDEO_DIR, file_name)):
+                self.update_path(file_name)
+
+        all_folders = []
+        for folder in ignore_filelist(os.listdir(self.VIDEO_DIR)):
+            folder_path = os.path.join(self.VIDEO_DIR, folder)
+            if layout == "char" and len(folder) == 1:
+                all_folders.append(folder_path)
+            elif layout == "hash" and len(folder) == 2:
+                all_sub_folders = ignore_filelist(os.listdir(folder_path))
+                all_folders.extend(
+                    [os.path.join(folder_path, i) for i in all_sub_folders]
+                )
+
+        return all_folders
+
     def update_path(self, file_name):
         """reorganize thumbnails into folders as update path from v0.0.5"""
-        folder_name = file_name[0].lower()
+        youtube_id = self.thumb_file_id(file_name)
+        folder_name = ThumbLayout.get_folder(youtube_id, self.state["layout"])
         folder_path = os.path.join(self.VIDEO_DIR, folder_name)
         old_file = os.path.join(self.VIDEO_DIR, file_name)
         new_file = os.path.join(folder_path, file_name)
         os.makedirs(folder_path, exist_ok=True)
         os.rename(old_file, new_file)
 
-    def get_needed_thumbs(self, missing_only=False):
-        """get a list of all missing thumbnails"""
-        all_thumbs = self.get_all_thumbs()
-        all_indexed = queue.PendingList().get_all_indexed()
-        all_in_queue, all_ignored = queue.PendingList().get_all_pending()
+    @staticmethod
+    def get_thumb_sources(youtube_ids=False):
+        """get dict of youtube_id: thumb_url for indexed and queued videos
+        limit to youtube_ids if passed, only fetch the two needed fields
+        """
+        if youtube_ids:
+            query = {"ids": {"values": list(youtube_ids)}}
+        else:
+            query = {"match_all": {}}
 
-        needed_thumbs = []
-        for video in all_indexed:
-            youtube_id = video["youtube_id"]
-            thumb_url = video["vid_thumb_url"]
-            if missing_only:
-                if youtube_id + ".jpg" not in all_thumbs:
-                    needed_thumbs.append((youtube_id, thumb_url))
-            else:
-                needed_thumbs.append((youtube_id, thumb_url))
+        thumb_sources = {}
+        for index_name in ["ta_video", "ta_download"]:
+            data = {
+                "query": query,
+                "sort": [{"youtube_id": {"order": "asc"}}],
+                "_source": ["youtube_id", "vid_thumb_url"],
+            }
+            all_videos = IndexPaginate(index_name, data).get_results()
+            for video in all_videos:
+                thumb_sources[video["youtube_id"]] = video["vid_thumb_url"]
 
-        for video in all_in_queue + all_ignored:
-            youtube_id = video["youtube_id"]
-            thumb_url = video["vid_thumb_url"]
-            if missing_only:
-                if youtube_id + ".jpg" not in all_thumbs:
-                    needed_thumbs.append((youtube_id, thumb_url))
-            else:
-                needed_thumbs.append((youtube_id, thumb_url))
+        return thumb_sources
+
+    def get_needed_thumbs(self, thumb_sources, all_thumbs=False):
+        """get a list of missing thumbnails from thumb_sources"""
+        if all_thumbs is False:
+            all_thumbs = self.get_all_thumbs()
+
+        needed_thumbs = [
+            (youtube_id, thumb_url)
+            for youtube_id, thumb_url in thumb_sources.items()
+            if youtube_id + ".jpg" not in all_thumbs
+        ]
 
         return needed_thumbs
 
@@ -86,7 +324,7 @@ class ThumbManager:
         """get all channel artwork"""
         all_channel_art = os.listdir(self.CHANNEL_DIR)
         files = [i[0:24] for i in all_channel_art]
-        cached_channel_ids = [k for (k, v) in Counter(files).items() if v > 1]
+        cached_channel_ids = {k for (k, v) in Counter(files).items() if v > 1}
         channel_sub = subscriptions.ChannelSubscription()
         channels = channel_sub.get_channels(subscribed_only=False)
 
@@ -105,7 +343,7 @@ class ThumbManager:
     def get_missing_playlists(self):
         """get all missing playlist artwork"""
         all_downloaded = ignore_filelist(os.listdir(self.PLAYLIST_DIR))
-        all_ids_downloaded = [i.replace(".jpg", "") for i in all_downloaded]
+        all_ids_downloaded = {i.replace(".jpg", "") for i in all_downloaded}
         playlist_sub = subscriptions.PlaylistSubscription()
         playlists = playlist_sub.get_playlists(subscribed_only=False)
 
@@ -118,8 +356,18 @@ class ThumbManager:
 
         return missing_playlists
 
-    def get_raw_img(self, img_url, thumb_type):
-        """get raw image from youtube and handle 404"""
+    def _open_img(self, img_bytes, thumb_type):
+        """open fetched image bytes, fall back to default image"""
+        from PIL import Image
+
+        if not img_bytes:
+            # use default
+            return Image.open(self.get_default_img(thumb_type))
+
+        return Image.open(BytesIO(img_bytes))
+
+    def get_default_img(self, thumb_type):
+        """get path to default image of thumb_type"""
         try:
             app_root = self.CONFIG["application"]["app_root"]
         except KeyError:
@@ -137,122 +385,424 @@ class ThumbManager:
                 app_root, "static/img/default-channel-banner.jpg"
             ),
         }
-        if img_url:
-            try:
-                response = requests.get(img_url, stream=True)
-            except ConnectionError:
-                sleep(5)
-                response = requests.get(img_url, stream=True)
-            if not response.ok and not response.status_code == 404:
-                print("retry thumbnail download for " + img_url)
-                sleep(5)
-                response = requests.get(img_url, stream=True)
-        else:
-            response = False
-        if not response or response.status_code == 404:
-            # use default
-            img_raw = Image.open(default_map[thumb_type])
-        else:
-            # use response
-            img_obj = response.raw
-            img_raw = Image.open(img_obj)
 
-        return img_raw
+        return default_map[thumb_type]
+
+    def _write_img(self, job, img_bytes):
+        """processing stage: decode, crop, convert and save image"""
+        img_raw = self._open_img(img_bytes, job["thumb_type"])
+        if job.get("crop"):
+            width, height = img_raw.size
+            if not width / height == 16 / 9:
+                new_height = width / 16 * 9
+                offset = (height - new_height) / 2
+                img_raw = img_raw.crop((0, offset, width, height - offset))
+
+        os.makedirs(os.path.split(job["path"])[0], exist_ok=True)
+        img_raw = img_raw.convert("RGB")
+        self._save_replace(img_raw, job["path"], "JPEG")
+        if job.get("youtube_id"):
+            self._write_variants(img_raw, job["youtube_id"])
+            if job.get("meta"):
+                self.set_thumb_meta(job["youtube_id"], job["meta"])
+
+            # keep migration target in sync while migrating
+            state = self.layout.get_state()
+            if state["target"]:
+                self._link_vid_thumb(job["youtube_id"], state, force=True)
+
+    def get_thumb_meta(self, youtube_id):
+        """get source url, validators and hash of cached thumbnail"""
+        reply = RedisArchivist().redis_connection.execute_command(
+            "HGET", RedisArchivist.NAME_SPACE + self.META_KEY, youtube_id
+        )
+        if not reply:
+            return False
+
+        return json.loads(reply)
+
+    def set_thumb_meta(self, youtube_id, meta):
+        """store source url, validators and hash of cached thumbnail"""
+        RedisArchivist().redis_connection.execute_command(
+            "HSET",
+            RedisArchivist.NAME_SPACE + self.META_KEY,
+            youtube_id,
+            json.dumps(meta),
+        )
+
+    def refresh_vid_thumb(self, youtube_id, thumb_url):
+        """conditional refresh, only rewrite thumbnail if content changed
+        returns True if thumbnail got rewritten
+        """
+        cached = self.get_thumb_meta(youtube_id)
+        thumb_path = os.path.join(
+            self.CACHE_DIR, self.vid_thumb_path(youtube_id)
+        )
+        if (
+            not cached
+            or cached["url"] != thumb_url
+            or not os.path.exists(thumb_path)
+        ):
+            self.delete_vid_thumb(youtube_id)
+            self.download_vid([(youtube_id, thumb_url)], notify=False)
+            return True
+
+        img_bytes, meta = ThumbFetcher().fetch_meta(thumb_url, cached=cached)
+        if not img_bytes:
+            # not modified or failed, keep what's cached
+            return False
+
+        if meta["hash"] == cached["hash"]:
+            # same content, refresh validators only
+            self.set_thumb_meta(youtube_id, meta)
+            return False
+
+        job = {
+            "url": thumb_url,
+            "thumb_type": "video",
+            "path": thumb_path,
+            "crop": True,
+            "youtube_id": youtube_id,
+            "meta": meta,
+        }
+        self._write_img(job, img_bytes)
+        return True
+
+    def import_vid_thumb(self, youtube_id, img_path, thumb_url):
+        """process local thumbnail file instead of downloading"""
+        with open(img_path, "rb") as img_file:
+            img_bytes = img_file.read()
+
+        job = {
+            "url": thumb_url,
+            "thumb_type": "video",
+            "path": os.path.join(
+                self.CACHE_DIR, self.vid_thumb_path(youtube_id)
+            ),
+            "crop": True,
+            "youtube_id": youtube_id,
+            # no validators, first refresh compares content hash
+            "meta": {
+                "url": thumb_url,
+                "etag": None,
+                "last_modified": None,
+                "hash": content_hash(img_bytes),
+            },
+        }
+        self._write_img(job, img_bytes)
+
+    def _write_variants(self, img_raw, youtube_id):
+        """save resized webp variants of video thumbnail"""
+        from PIL import Image
+
+        width, height = img_raw.size
+        for variant_width in self.VARIANT_WIDTHS:
+            if variant_width >= width:
+                variant = img_raw
+            else:
+                variant_height = round(height * variant_width / width)
+                variant = img_raw.resize(
+                    (variant_width, variant_height), Image.LANCZOS
+                )
+            variant_path = os.path.join(
+                self.CACHE_DIR, self.vid_thumb_path(youtube_id, variant_width)
+            )
+            self._save_replace(
+                variant, variant_path, "WEBP", quality=80, method=4
+            )
+
+    @staticmethod
+    def _save_replace(img, path, img_format, **kwargs):
+        """save to temp file and replace path, never write into a file
+        hardlinked to other channels or thumbnail layouts
+        """
+        folder, file_name = os.path.split(path)
+        temp_fd, temp_path = tempfile.mkstemp(
+            dir=folder, prefix=f".{file_name}.", suffix=".tmp"
+        )
+        os.close(temp_fd)
+        try:
+            # mkstemp is private, cache gets served by nginx
+            os.chmod(temp_path, 0o644)
+            img.save(temp_path, img_format, **kwargs)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def get_lqip(self, youtube_id):
+        """build tiny base64 placeholder from cached thumbnail"""
+        from PIL import Image
+
+        thumb_path = os.path.join(
+            self.CACHE_DIR, self.vid_thumb_path(youtube_id)
+        )
+        if not os.path.exists(thumb_path):
+            return False
+
+        with Image.open(thumb_path) as img_raw:
+            img_lqip = img_raw.convert("RGB").resize(self.LQIP_SIZE)
+
+        buffer = BytesIO()
+        img_lqip.save(buffer, "WEBP", quality=40)
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+
+        return f"data:image/webp;base64,{encoded}"
 
     def download_vid(self, missing_thumbs, notify=True):
         """download all missing thumbnails from list"""
         print(f"downloading {len(missing_thumbs)} thumbnails")
-        for idx, (youtube_id, thumb_url) in enumerate(missing_thumbs):
-            folder_path = os.path.join(self.VIDEO_DIR, youtube_id[0].lower())
+        jobs = []
+        for youtube_id, thumb_url in missing_thumbs:
             thumb_path = os.path.join(
                 self.CACHE_DIR, self.vid_thumb_path(youtube_id)
             )
-
-            os.makedirs(folder_path, exist_ok=True)
-            img_raw = self.get_raw_img(thumb_url, "video")
-
-            width, height = img_raw.size
-            if not width / height == 16 / 9:
-                new_height = width / 16 * 9
-                offset = (height - new_height) / 2
-                img_raw = img_raw.crop((0, offset, width, height - offset))
-            img_raw.convert("RGB").save(thumb_path)
-
-            progress = f"{idx + 1}/{len(missing_thumbs)}"
-            if notify:
-                mess_dict = {
-                    "status": "message:add",
-                    "level": "info",
-                    "title": "Processing Videos",
-                    "message": "Downloading Thumbnails, Progress: " + progress,
+            jobs.append(
+                {
+                    "url": thumb_url,
+                    "thumb_type": "video",
+                    "path": thumb_path,
+                    "crop": True,
+                    "youtube_id": youtube_id,
                 }
-                if idx + 1 == len(missing_thumbs):
-                    RedisArchivist().set_message(
-                        "message:add", mess_dict, expire=4
-                    )
-                else:
-                    RedisArchivist().set_message("message:add", mess_dict)
+            )
+
+        fetcher = ThumbFetcher(notify=self._notify_vid if notify else False)
+        fetcher.run(jobs, self._write_img)
 
-            if idx + 1 % 25 == 0:
-                print("thumbnail progress: " + progress)
+    @staticmethod
+    def _notify_vid(done, total):
+        """send video thumbnail progress"""
+        mess_dict = {
+            "status": "message:add",
+            "level": "info",
+            "title": "Processing Videos",
+            "message": f"Downloading Thumbnails, Progress: {done}/{total}",
+        }
+        if done == total:
+            RedisArchivist().set_message("message:add", mess_dict, expire=4)
+        else:
+            RedisArchivist().set_message("message:add", mess_dict)
 
     def download_chan(self, missing_channels):
-        """download needed artwork for channels"""
+        """download needed artwork for channels
+        fetch identical urls once, link identical content
+        """
         print(f"downloading {len(missing_channels)} channel artwork")
+        jobs = {}
         for channel in missing_channels:
             channel_id, channel_thumb, channel_banner = channel
-
             thumb_path = os.path.join(
                 self.CHANNEL_DIR, channel_id + "_thumb.jpg"
             )
-            img_raw = self.get_raw_img(channel_thumb, "icon")
-            img_raw.convert("RGB").save(thumb_path)
-
             banner_path = os.path.join(
                 self.CHANNEL_DIR, channel_id + "_banner.jpg"
             )
-            img_raw = self.get_raw_img(channel_banner, "banner")
-            img_raw.convert("RGB").save(banner_path)
+            for url, thumb_type, path in [
+                (channel_thumb, "icon", thumb_path),
+                (channel_banner, "banner", banner_path),
+            ]:
+                job = jobs.setdefault(
+                    (url, thumb_type),
+                    {"url": url, "thumb_type": thumb_type, "copies": []},
+                )
+                job["copies"].append(path)
 
-            mess_dict = {
-                "status": "message:download",
-                "level": "info",
-                "title": "Processing Channels",
-                "message": "Downloading Channel Art.",
-            }
-            RedisArchivist().set_message("message:download", mess_dict)
+        written = {}
+        write_lock = threading.Lock()
+
+        def processor(job, img_bytes):
+            """write first of identical content only"""
+            if img_bytes:
+                key = (job["thumb_type"], content_hash(img_bytes))
+            else:
+                key = (job["thumb_type"], False)
+
+            with write_lock:
+                job["source"] = written.setdefault(key, job["copies"][0])
+
+            if job["source"] == job["copies"][0]:
+                self._write_img(dict(job, path=job["source"]), img_bytes)
+
+        fetcher = ThumbFetcher(notify=self._notify_art("Channels"))
+        fetcher.run(list(jobs.values()), processor)
+        for job in jobs.values():
+            for path in job["copies"]:
+                if path != job["source"]:
+                    self._link_art(job["source"], path)
+
+    @staticmethod
+    def _link_art(source, path):
+        """hardlink identical artwork, copy if not supported"""
+        if os.path.exists(path):
+            os.remove(path)
+
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copy2(source, path)
+
+    def queue_channel(self, channel_id, channel_thumb, channel_banner):
+        """add channel artwork to queue, True if not already queued"""
+        added = RedisArchivist().redis_connection.execute_command(
+            "HSET",
+            RedisArchivist.NAME_SPACE + self.CHANNEL_QUEUE,
+            channel_id,
+            json.dumps([channel_thumb, channel_banner]),
+        )
+        return bool(added)
+
+    def download_queued_channels(self):
+        """download artwork of all queued channels"""
+        while True:
+            pipeline = RedisArchivist().redis_connection.pipeline()
+            pipeline.execute_command(
+                "HGETALL", RedisArchivist.NAME_SPACE + self.CHANNEL_QUEUE
+            )
+            pipeline.execute_command(
+                "DEL", RedisArchivist.NAME_SPACE + self.CHANNEL_QUEUE
+            )
+            queued, _ = pipeline.execute()
+            if not queued:
+                return
+
+            missing_channels = [
+                (channel_id.decode(), *json.loads(channel_art))
+                for channel_id, channel_art in queued.items()
+            ]
+            self.download_chan(missing_channels)
 
     def download_playlist(self, missing_playlists):
         """download needed artwork for playlists"""
         print(f"downloading {len(missing_playlists)} playlist artwork")
+        jobs = []
         for playlist in missing_playlists:
             playlist_id, playlist_thumb_url = playlist
             thumb_path = os.path.join(self.PLAYLIST_DIR, playlist_id + ".jpg")
-            img_raw = self.get_raw_img(playlist_thumb_url, "video")
-            img_raw.convert("RGB").save(thumb_path)
+            jobs.append(
+                {
+                    "url": playlist_thumb_url,
+                    "thumb_type": "video",
+                    "path": thumb_path,
+                }
+            )
+
+        fetcher = ThumbFetcher(notify=self._notify_art("Playlists"))
+        fetcher.run(jobs, self._write_img)
+
+    def queue_playlist(self, playlist_id, playlist_thumb):
+        """add playlist artwork to queue, deduplicated by playlist_id"""
+        RedisArchivist().redis_connection.execute_command(
+            "HSET",
+            RedisArchivist.NAME_SPACE + self.PLAYLIST_QUEUE,
+            playlist_id,
+            playlist_thumb,
+        )
+
+    def dequeue_playlist(self, playlist_id):
+        """remove playlist artwork from queue, playlist not indexed"""
+        RedisArchivist().redis_connection.execute_command(
+            "HDEL",
+            RedisArchivist.NAME_SPACE + self.PLAYLIST_QUEUE,
+            playlist_id,
+        )
+
+    def download_queued_playlists(self):
+        """download missing artwork of all queued playlists"""
+        pipeline = RedisArchivist().redis_connection.pipeline()
+        pipeline.execute_command(
+            "HGETALL", RedisArchivist.NAME_SPACE + self.PLAYLIST_QUEUE
+        )
+        pipeline.execute_command(
+            "DEL", RedisArchivist.NAME_SPACE + self.PLAYLIST_QUEUE
+        )
+        queued, _ = pipeline.execute()
+
+        missing_playlists = []
+        for playlist_id, playlist_thumb in queued.items():
+            playlist_id = playlist_id.decode()
+            thumb_path = os.path.join(self.PLAYLIST_DIR, playlist_id + ".jpg")
+            if not os.path.exists(thumb_path):
+                missing_playlists.append(
+                    (playlist_id, playlist_thumb.decode())
+                )
+
+        if missing_playlists:
+            self.download_playlist(missing_playlists)
 
+    @staticmethod
+    def _notify_art(art_type):
+        """build notify function for channel or playlist artwork"""
+
+        def notify(done, total):
             mess_dict = {
                 "status": "message:download",
                 "level": "info",
-                "title": "Processing Playlists",
-                "message": "Downloading Playlist Art.",
+                "title": f"Processing {art_type}",
+                "message": f"Downloading {art_type} Art: {done}/{total}",
             }
             RedisArchivist().set_message("message:download", mess_dict)
 
-    @staticmethod
-    def vid_thumb_path(youtube_id):
-        """build expected path for video thumbnail from youtube_id"""
-        folder_name = youtube_id[0].lower()
+        return notify
+
+    def vid_thumb_path(self, youtube_id, width=False, layout=False):
+        """build expected path for video thumbnail from youtube_id
+        pass width to get path of resized webp variant
+        """
+        folder_name = ThumbLayout.get_folder(
+            youtube_id, layout or self.state["layout"]
+        )
         folder_path = os.path.join("videos", folder_name)
-        thumb_path = os.path.join(folder_path, youtube_id + ".jpg")
+        if width:
+            file_name = f"{youtube_id}_{width}.webp"
+        else:
+            file_name = youtube_id + ".jpg"
+        thumb_path = os.path.join(folder_path, file_name)
         return thumb_path
 
+    def vid_thumb_srcset(self, youtube_id):
+        """build srcset of resized variants, False if not built yet"""
+        all_variants = []
+        for width in self.VARIANT_WIDTHS:
+            variant_path = self.vid_thumb_path(youtube_id, width)
+            if not os.path.exists(os.path.join(self.CACHE_DIR, variant_path)):
+                return False
+
+            all_variants.append(f"/cache/{variant_path} {width}w")
+
+        return ", ".join(all_variants)
+
+    @staticmethod
+    def thumb_file_id(file_name):
+        """extract youtube_id from thumbnail or variant file name"""
+        name, extension = os.path.splitext(file_name)
+        if extension == ".webp":
+            name = name.rsplit("_", 1)[0]
+
+        return name
+
+    def _get_vid_thumb_paths(self, youtube_id, layout):
+        """all relative paths of thumbnail and variants in layout"""
+        all_paths = [self.vid_thumb_path(youtube_id, layout=layout)] + [
+            self.vid_thumb_path(youtube_id, width=i, layout=layout)
+            for i in self.VARIANT_WIDTHS
+        ]
+        return all_paths
+
     def delete_vid_thumb(self, youtube_id):
-        """delete video thumbnail if exists"""
-        thumb_path = self.vid_thumb_path(youtube_id)
-        to_delete = os.path.join(self.CACHE_DIR, thumb_path)
-        if os.path.exists(to_delete):
-            os.remove(to_delete)
+        """delete video thumbnail and variants if exists in any layout"""
+        all_paths = []
+        for layout in ThumbLayout.LAYOUTS:
+            all_paths.extend(self._get_vid_thumb_paths(youtube_id, layout))
+
+        for thumb_path in all_paths:
+            to_delete = os.path.join(self.CACHE_DIR, thumb_path)
+            if os.path.exists(to_delete):
+                os.remove(to_delete)
+
+        RedisArchivist().redis_connection.execute_command(
+            "HDEL", RedisArchivist.NAME_SPACE + self.META_KEY, youtube_id
+        )
 
     def delete_chan_thumb(self, channel_id):
         """delete all artwork of channel"""
@@ -263,20 +813,193 @@ class ThumbManager:
         if os.path.exists(banner):
             os.remove(banner)
 
-    def cleanup_downloaded(self):
-        """find downloaded thumbnails without video indexed"""
+    def cleanup_downloaded(self, thumb_sources, all_thumbs=False):
+        """delete downloaded thumbnails without video indexed"""
+        if all_thumbs is False:
+            all_thumbs = self.get_all_thumbs()
+
+        all_thumb_ids = {self.thumb_file_id(i) for i in all_thumbs}
+        for youtube_id in all_thumb_ids - thumb_sources.keys():
+            self.delete_vid_thumb(youtube_id)
+
+    def validate_all_vids(self):
+        """full scan for missing and orphaned video thumbnails"""
+        # changes tracked from here on are covered by this scan
+        RedisSet(self.ADDED_KEY).clear()
+        RedisSet(self.DELETED_KEY).clear()
+        RedisArchivist().del_message(self.RESCAN_KEY)
+
         all_thumbs = self.get_all_thumbs()
-        all_indexed = self.get_needed_thumbs()
-        all_needed_thumbs = [i[0] + ".jpg" for i in all_indexed]
-        for thumb in all_thumbs:
-            if thumb not in all_needed_thumbs:
-                # cleanup
-                youtube_id = thumb.rstrip(".jpg")
-                self.delete_vid_thumb(youtube_id)
+        thumb_sources = self.get_thumb_sources()
+        missing_thumbs = self.get_needed_thumbs(thumb_sources, all_thumbs)
+        self.download_vid(missing_thumbs)
+        self.cleanup_downloaded(thumb_sources, all_thumbs)
+
+    def validate_changed_vids(self):
+        """only validate videos added or deleted since last run"""
+        added = RedisSet(self.ADDED_KEY).pop_all()
+        deleted = RedisSet(self.DELETED_KEY).pop_all()
+        if not added and not deleted:
+            return
+
+        print(f"validate thumbnails of {len(added | deleted)} changed videos")
+        thumb_sources = self.get_thumb_sources(added | deleted)
+        missing_thumbs = [
+            (youtube_id, thumb_url)
+            for youtube_id, thumb_url in thumb_sources.items()
+            if not os.path.exists(
+                os.path.join(self.CACHE_DIR, self.vid_thumb_path(youtube_id))
+            )
+        ]
+        self.download_vid(missing_thumbs)
+
+        # deleted and not indexed again in the meantime
+        for youtube_id in deleted - thumb_sources.keys():
+            self.delete_vid_thumb(youtube_id)
+
+    def request_missing(self, file_name):
+        """queue thumbnail requested but missing in cache
+        returns True if fetch task needs to be started
+        """
+        youtube_id = self.thumb_file_id(file_name)
+        if not re.fullmatch(r"[\w-]{11}", youtube_id):
+            return False
+
+        conn = RedisArchivist().redis_connection
+        name_space = RedisArchivist.NAME_SPACE
+        first_request = conn.execute_command(
+            "SET",
+            f"{name_space}{self.MISSING_KEY}:{youtube_id}",
+            1,
+            "NX",
+            "EX",
+            self.MISSING_RETRY,
+        )
+        if not first_request:
+            return False
+
+        RedisSet(self.MISSING_KEY).add([youtube_id])
+        # single task for all requests in batch window
+        new_batch = conn.execute_command(
+            "SET",
+            f"{name_space}{self.MISSING_KEY}:task",
+            1,
+            "NX",
+            "EX",
+            self.MISSING_BATCH,
+        )
+        return bool(new_batch)
+
+    def download_requested(self):
+        """download queued thumbnails of indexed and pending videos"""
+        requested_set = RedisSet(self.MISSING_KEY)
+        while True:
+            requested = requested_set.pop_all()
+            if not requested:
+                return
+
+            thumb_sources = self.get_thumb_sources(requested)
+            print(f"fetch {len(thumb_sources)} requested thumbnails")
+            self.download_vid(list(thumb_sources.items()), notify=False)
+
+    @staticmethod
+    def is_queued(queue_key):
+        """check if items got queued after last drain of queue_key"""
+        return bool(
+            RedisArchivist().redis_connection.execute_command(
+                "EXISTS", RedisArchivist.NAME_SPACE + queue_key
+            )
+        )
+
+    @classmethod
+    def track_added(cls, youtube_ids):
+        """remember new videos for next incremental validation"""
+        RedisSet(cls.ADDED_KEY).add(youtube_ids)
+
+    @classmethod
+    def track_deleted(cls, youtube_ids):
+        """remember deleted videos for next incremental validation"""
+        RedisSet(cls.DELETED_KEY).add(youtube_ids)
+
+    @classmethod
+    def request_rescan(cls):
+        """bulk delete without known ids, next validation does full scan"""
+        RedisArchivist().set_message(
+            cls.RESCAN_KEY, {"status": True}, expire=False
+        )
+
+    def needs_rescan(self):
+        """check if a bulk change requested a full scan"""
+        return RedisArchivist().get_message(self.RESCAN_KEY)["status"]
+
+    def backfill_variants(self):
+        """build missing variants and lqip of already cached thumbnails"""
+        data = {
+            "query": {"match_all": {}},
+            "sort": [{"youtube_id": {"order": "asc"}}],
+            "_source": ["youtube_id", "vid_thumb_lqip"],
+        }
+        all_videos = IndexPaginate("ta_video", data).get_results()
+        print(f"backfill thumbnail variants for {len(all_videos)} videos")
+        notify = self._notify_art("Thumbnails")
+        bulk_list = []
+        with ThreadPoolExecutor(ThumbFetcher.PROCESS_WORKERS) as pool:
+            all_lqip = pool.map(self._backfill_single, all_videos)
+            for idx, (youtube_id, lqip) in enumerate(all_lqip):
+                if lqip:
+                    action = {
+                        "update": {"_id": youtube_id, "_index": "ta_video"}
+                    }
+                    source = {"doc": {"vid_thumb_lqip": lqip}}
+                    bulk_list.append(json.dumps(action))
+                    bulk_list.append(json.dumps(source))
+                if len(bulk_list) >= 1000:
+                    self._bulk_update(bulk_list)
+                    bulk_list = []
+                if (idx + 1) % 100 == 0:
+                    notify(idx + 1, len(all_videos))
+
+        self._bulk_update(bulk_list)
+
+    def _backfill_single(self, video):
+        """write missing variants, return lqip if not indexed yet"""
+        from PIL import Image
+
+        youtube_id = video["youtube_id"]
+        thumb_path = os.path.join(
+            self.CACHE_DIR, self.vid_thumb_path(youtube_id)
+        )
+        if not os.path.exists(thumb_path):
+            return youtube_id, False
+
+        if not self.vid_thumb_srcset(youtube_id):
+            with Image.open(thumb_path) as img_raw:
+                self._write_variants(img_raw.convert("RGB"), youtube_id)
+
+        if video.get("vid_thumb_lqip"):
+            return youtube_id, False
+
+        return youtube_id, self.get_lqip(youtube_id)
+
+    @staticmethod
+    def _bulk_update(bulk_list):
+        """send bulk update to es"""
+        if not bulk_list:
+            return
+
+        # add last newline
+        bulk_list.append("\n")
+        query_str = "\n".join(bulk_list)
+        _, _ = ElasticWrap("_bulk").post(query_str, ndjson=True)
 
     def get_thumb_list(self):
         """get list of mediafiles and matching thumbnails"""
-        all_indexed = queue.PendingList().get_all_indexed()
+        data = {
+            "query": {"match_all": {}},
+            "sort": [{"youtube_id": {"order": "asc"}}],
+            "_source": ["youtube_id", "media_url"],
+        }
+        all_indexed = IndexPaginate("ta_video", data).get_results()
         video_list = []
         for video in all_indexed:
             youtube_id = video["youtube_id"]
@@ -286,6 +1009,7 @@ class ThumbManager:
             )
             video_list.append(
                 {
+                    "youtube_id": youtube_id,
                     "media_url": media_url,
                     "thumb_path": thumb_path,
                 }
@@ -293,34 +1017,213 @@ class ThumbManager:
 
         return video_list
 
+    def write_all_thumbs(self, video_list):
+        """rewrite the thumbnail into media files in parallel
+        resume from checkpoint of previous interrupted run
+        """
+        checkpoint = RedisSet(self.EMBED_CHECKPOINT)
+        all_done = checkpoint.get_all()
+        to_embed = [i for i in video_list if i["youtube_id"] not in all_done]
+        print(f"embed thumbnails: {len(all_done)} done, {len(to_embed)} left")
+
+        start = time()
+        written = 0
+        processed = []
+        with ThreadPoolExecutor(self.EMBED_WORKERS) as pool:
+            all_embedded = pool.map(embed_thumb, to_embed)
+            for idx, (youtube_id, changed) in enumerate(all_embedded):
+                processed.append(youtube_id)
+                written = written + int(changed)
+                if len(processed) == 50 or idx + 1 == len(to_embed):
+                    checkpoint.add(processed)
+                    processed = []
+                    self._notify_embed(idx + 1, len(to_embed), written, start)
+
+        checkpoint.clear()
+
     @staticmethod
-    def write_all_thumbs(video_list):
-        """rewrite the thumbnail into media file"""
-
-        counter = 1
-        for video in video_list:
-            # loop through all videos
-            media_url = video["media_url"]
-            thumb_path = video["thumb_path"]
-
-            mutagen_vid = MP4(media_url)
-            with open(thumb_path, "rb") as f:
-                mutagen_vid["covr"] = [
-                    MP4Cover(f.read(), imageformat=MP4Cover.FORMAT_JPEG)
-                ]
-            mutagen_vid.save()
-            if counter % 50 == 0:
-                print(f"thumbnail write progress {counter}/{len(video_list)}")
-            counter = counter + 1
-
-
-def validate_thumbnails():
-    """check if all thumbnails are there and organized correctly"""
+    def _notify_embed(done, total, written, start):
+        """report progress and throughput of embedding"""
+        rate = done / max(time() - start, 1)
+        message = (
+            f"Progress: {done}/{total}, {written} rewritten, "
+            + f"{rate:.1f} files/s"
+        )
+        print(f"thumbnail embed {message}")
+        mess_dict = {
+            "status": "message:setting",
+            "level": "info",
+            "title": "Embedding thumbnails",
+            "message": message,
+        }
+        expire = 10 if done == total else True
+        RedisArchivist().set_message("message:setting", mess_dict, expire)
+
+    def migrate_layout(self, target):
+        """move thumbnails to target layout in batches of folders
+        files get hardlinked first, so paths stay valid during migration
+        """
+        my_lock = RedisArchivist().get_lock("thumb_layout")
+        if not my_lock.acquire(blocking=False):
+            print("thumbnail layout migration already running")
+            return
+
+        try:
+            self._run_migration(target)
+        finally:
+            my_lock.release()
+
+    def _run_migration(self, target):
+        """link into target layout, switch and clean up"""
+        self.state = self.layout.get_state()
+        source = self.state["layout"]
+        if self.state["target"]:
+            # resume interrupted migration
+            target = self.state["target"]
+        elif source == target:
+            self._cleanup_layouts(target)
+            return
+
+        print(f"migrate thumbnail layout from {source} to {target}")
+        self.layout.set_state(source, target=target)
+        checkpoint = RedisSet(self.MIGRATE_CHECKPOINT)
+        all_done = checkpoint.get_all()
+        all_folders = self.get_thumb_folders(source)
+        for idx, folder_path in enumerate(all_folders):
+            if folder_path in all_done:
+                continue
+
+            for file_name in ignore_filelist(os.listdir(folder_path)):
+                old_path = os.path.join(folder_path, file_name)
+                self._link_file(old_path, target)
+
+            checkpoint.add([folder_path])
+            self._notify_migrate(idx + 1, len(all_folders))
+
+        # switch, then remove old links
+        self.layout.set_state(target)
+        self.state = self.layout.get_state()
+        checkpoint.clear()
+        self._cleanup_layouts(target)
+
+    def _link_vid_thumb(self, youtube_id, state, force=False):
+        """link thumbnail and variants into migration target layout"""
+        for thumb_path in self._get_vid_thumb_paths(
+            youtube_id, state["layout"]
+        ):
+            old_path = os.path.join(self.CACHE_DIR, thumb_path)
+            if os.path.exists(old_path):
+                self._link_file(old_path, state["target"], force=force)
+
+    def _link_file(self, old_path, target, force=False):
+        """hardlink file into target layout, copy if not supported"""
+        file_name = os.path.split(old_path)[-1]
+        youtube_id = self.thumb_file_id(file_name)
+        new_folder = os.path.join(
+            self.VIDEO_DIR, ThumbLayout.get_folder(youtube_id, target)
+        )
+        new_path = os.path.join(new_folder, file_name)
+        if os.path.exists(new_path):
+            if not force or os.path.samefile(old_path, new_path):
+                return
+
+            os.remove(new_path)
+
+        os.makedirs(new_folder, exist_ok=True)
+        try:
+            os.link(old_path, new_path)
+        except OSError:
+            shutil.copy2(old_path, new_path)
+
+    def _cleanup_layouts(self, target):
+        """remove files left in other layouts after switch"""
+        for layout in ThumbLayout.LAYOUTS:
+            if layout == target:
+                continue
+
+            for folder_path in self.get_thumb_folders(layout):
+                for file_name in ignore_filelist(os.listdir(folder_path)):
+                    old_path = os.path.join(folder_path, file_name)
+                    # catch up on files written during the switch
+                    self._link_file(old_path, target)
+                    os.remove(old_path)
+
+                self._remove_empty(folder_path)
+
+    def _remove_empty(self, folder_path):
+        """remove empty folder and empty parents inside video cache"""
+        while folder_path != self.VIDEO_DIR:
+            try:
+                os.rmdir(folder_path)
+            except OSError:
+                return
+
+            folder_path = os.path.dirname(folder_path)
+
+    @staticmethod
+    def _notify_migrate(done, total):
+        """send layout migration progress"""
+        mess_dict = {
+            "status": "message:setting",
+            "level": "info",
+            "title": "Migrating thumbnail layout",
+            "message": f"Progress: {done}/{total} folders",
+        }
+        expire = 10 if done == total else True
+        RedisArchivist().set_message("message:setting", mess_dict, expire)
+
+
+def embed_thumb(video):
+    """embed cached thumbnail as cover art, skip if already matching
+    returns youtube_id and if the media file got rewritten
+    """
+    from mutagen import MutagenError
+    from mutagen.mp4 import MP4, MP4Cover
+
+    youtube_id = video["youtube_id"]
+    try:
+        with open(video["thumb_path"], "rb") as f:
+            thumb_bytes = f.read()
+        mutagen_vid = MP4(video["media_url"])
+    except (FileNotFoundError, MutagenError):
+        print(f"{youtube_id}: failed to embed thumbnail")
+        return youtube_id, False
+
+    covers = mutagen_vid.get("covr")
+    if covers and content_hash(covers[0]) == content_hash(thumb_bytes):
+        return youtube_id, False
+
+    mutagen_vid["covr"] = [
+        MP4Cover(thumb_bytes, imageformat=MP4Cover.FORMAT_JPEG)
+    ]
+    mutagen_vid.save()
+
+    return youtube_id, True
+
+
+def content_hash(img_bytes):
+    """hash to compare image content"""
+    return hashlib.sha1(bytes(img_bytes)).hexdigest()
+
+
+def validate_thumbnails(incremental=False):
+    """check if all thumbnails are there and organized correctly
+    incremental only looks at videos added or deleted since last run
+    """
     handler = ThumbManager()
-    thumbs_to_download = handler.get_needed_thumbs(missing_only=True)
-    handler.download_vid(thumbs_to_download)
+    config = AppConfig().config
+    target_layout = config["application"].get("thumb_layout", "char")
+    if handler.state["target"] or handler.state["layout"] != target_layout:
+        handler.migrate_layout(target_layout)
+
+    if incremental and not handler.needs_rescan():
+        handler.validate_changed_vids()
+    else:
+        handler.validate_all_vids()
+
     missing_channels = handler.get_missing_channels()
     handler.download_chan(missing_channels)
+    handler.download_queued_channels()
+    handler.download_queued_playlists()
     missing_playlists = handler.get_missing_playlists()
     handler.download_playlist(missing_playlists)
-    handler.cleanup_downloaded()
@@ -12,15 +12,18 @@ from datetime import datetime
 from time import sleep
 
 import requests
-import yt_dlp
+from home.src.download.known_ids import KnownIds
 from home.src.download.queue import PendingList
 from home.src.download.subscriptions import PlaylistSubscription
+from home.src.download.thumbnails import ThumbManager
 from home.src.es.connect import IndexPaginate
 from home.src.index.channel import YoutubeChannel
+from home.src.index.inventory import ArchiveInventory
 from home.src.index.playlist import YoutubePlaylist
 from home.src.index.video import YoutubeVideo, index_new_video
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import clean_string, ignore_filelist
+from home.src.ta.ratelimit import RateLimiter
 from home.src.ta.ta_redis import RedisArchivist, RedisQueue
 
 
@@ -39,6 +42,8 @@ class VideoDownloader:
 
     def run_queue(self):
         """setup download queue in redis loop until no more items"""
+        import yt_dlp
+
         queue = RedisQueue("dl_queue")
 
         limit_queue = self.config["downloads"]["limit_count"]
@@ -183,6 +188,8 @@ class VideoDownloader:
 
     def _dl_single_vid(self, youtube_id):
         """download single video"""
+        import yt_dlp
+
         dl_cache = self.config["application"]["cache_dir"] + "/download/"
 
         # check if already in cache to continue from there
@@ -190,6 +197,7 @@ class VideoDownloader:
         for file_name in all_cached:
             if youtube_id in file_name:
                 self.obs["outtmpl"] = os.path.join(dl_cache, file_name)
+        RateLimiter("yt_extract").acquire()
         with yt_dlp.YoutubeDL(self.obs) as ydl:
             try:
                 ydl.download([youtube_id])
@@ -233,6 +241,7 @@ class VideoDownloader:
         shutil.move(old_file_path, new_file_path)
         if host_uid and host_gid:
             os.chown(new_file_path, host_uid, host_gid)
+        ArchiveInventory().add_file(vid_dict["media_url"])
 
     def _delete_from_pending(self, youtube_id):
         """delete downloaded video from pending index if its there"""
@@ -242,6 +251,9 @@ class VideoDownloader:
         response = requests.delete(url, auth=es_auth)
         if not response.ok and not response.status_code == 404:
             print(response.text)
+            return
+
+        KnownIds().remove([youtube_id], kinds=["pending", "ignore"])
 
     def _add_subscribed_channels(self):
         """add all channels subscribed to refresh"""
@@ -293,6 +305,8 @@ class VideoDownloader:
                 else:
                     RedisArchivist().set_message("message:download", mess_dict)
 
+        ThumbManager().download_queued_playlists()
+
     @staticmethod
     def auto_delete_watched(autodelete_days):
         """delete watched videos after x days"""
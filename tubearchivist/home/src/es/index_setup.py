@@ -2,17 +2,21 @@
 functionality:
 - setup elastic index at first start
 - verify and update index mapping and settings if needed
+- skip verification if mapping and cluster haven't changed
 - backup and restore metadata
 """
 
+import hashlib
 import json
 import os
 import zipfile
 from datetime import datetime
 
 import requests
+from home.src.download.known_ids import KnownIds
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import ignore_filelist
+from home.src.ta.ta_redis import RedisArchivist
 
 
 class ElasticIndex:
@@ -72,6 +76,10 @@ class ElasticIndex:
         for key, value in expected_map.items():
             # nested
             if list(value.keys()) == ["properties"]:
+                if key not in now_map.keys():
+                    print(key, value)
+                    return True
+
                 for key_n, value_n in value["properties"].items():
                     if key_n not in now_map[key]["properties"].keys():
                         print(key_n, value_n)
@@ -444,6 +452,82 @@ def index_check(force_restore=False):
         print(f"ta_{index_name} index is created and up to date...")
 
 
+def get_index_fingerprint():
+    """identify mapping version and es cluster of last successful check"""
+    with open("home/src/es/index_mapping.json", "rb") as f:
+        mapping_hash = hashlib.sha1(f.read()).hexdigest()
+
+    config = AppConfig().config
+    es_url = config["application"]["es_url"]
+    es_auth = config["application"]["es_auth"]
+    response = requests.get(es_url, auth=es_auth)
+    if not response.ok:
+        print(response.text)
+        return False
+
+    fingerprint = {
+        "mapping": mapping_hash,
+        "cluster_uuid": response.json()["cluster_uuid"],
+    }
+
+    return fingerprint
+
+
+def all_indexes_exist():
+    """check that no index of the mapping got deleted since last check"""
+    config = AppConfig().config
+    es_url = config["application"]["es_url"]
+    es_auth = config["application"]["es_auth"]
+    url = f"{es_url}/_cat/indices/ta_*?format=json&h=index"
+    response = requests.get(url, auth=es_auth)
+    if not response.ok:
+        print(response.text)
+        return False
+
+    existing = {i["index"] for i in response.json()}
+    expected = {f"ta_{i['index_name']}" for i in get_mapping()}
+
+    return expected.issubset(existing)
+
+
+def is_index_checked(fingerprint):
+    """fingerprint matches last successful check and indexes still exist"""
+    last_checked = RedisArchivist().get_message("index:fingerprint")
+    if not fingerprint or last_checked != fingerprint:
+        return False
+
+    return all_indexes_exist()
+
+
+def index_check_cached():
+    """run index_check only once per deployment, skip when fingerprint match"""
+    fingerprint = get_index_fingerprint()
+    redis_archivist = RedisArchivist()
+    if is_index_checked(fingerprint):
+        print("index mapping unchanged, skip validation")
+        return
+
+    my_lock = redis_archivist.get_lock("index_check", timeout=600)
+    have_lock = my_lock.acquire(blocking=True, blocking_timeout=600)
+    if not have_lock:
+        print("Did not acquire index_check lock.")
+        return
+
+    try:
+        # other process might have finished validation while waiting
+        if is_index_checked(fingerprint):
+            print("index mapping validated by other process")
+            return
+
+        index_check()
+        if fingerprint:
+            redis_archivist.set_message(
+                "index:fingerprint", fingerprint, expire=False
+            )
+    finally:
+        my_lock.release()
+
+
 def get_available_backups():
     """return dict of available backups for settings view"""
     index_config = get_mapping()
@@ -481,3 +565,4 @@ def restore_from_backup(filename):
     backup_handler = ElasticBackup(index_config, reason=False)
     zip_content = backup_handler.unpack_zip_backup(filename)
     backup_handler.restore_json_files(zip_content)
+    KnownIds().invalidate()
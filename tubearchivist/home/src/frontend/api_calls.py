@@ -17,6 +17,7 @@ from home.src.index.video import YoutubeVideo
 from home.src.ta.helper import UrlListParser
 from home.src.ta.ta_redis import RedisArchivist, RedisQueue
 from home.tasks import (
+    backfill_thumb_variants,
     download_pending,
     download_single,
     extrac_dl,
@@ -71,6 +72,7 @@ class PostData:
             "deleteQueue": self._delete_queue,
             "manual-import": self._manual_import,
             "re-embed": self._re_embed,
+            "thumb-variants": self._thumb_variants,
             "db-backup": self._db_backup,
             "db-restore": self._db_restore,
             "fs-rescan": self._fs_rescan,
@@ -105,7 +107,7 @@ class PostData:
     def _rescan_pending():
         """look for new items in subscribed channels"""
         print("rescan subscribed channels")
-        update_subscribed.delay()
+        update_subscribed.delay(force=True)
         return {"success": True}
 
     def _ignore(self):
@@ -260,6 +262,13 @@ class PostData:
         re_sync_thumbs.delay()
         return {"success": True}
 
+    @staticmethod
+    def _thumb_variants():
+        """backfill resized thumbnails and placeholders"""
+        print("start thumbnail variant backfill")
+        backfill_thumb_variants.delay()
+        return {"success": True}
+
     @staticmethod
     def _db_backup():
         """backup es to zip from settings page"""
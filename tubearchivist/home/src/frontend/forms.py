@@ -68,6 +68,12 @@ class ApplicationSettingsForm(forms.Form):
         ("1", "enable Cast"),
     ]
 
+    THUMB_LAYOUT_CHOICES = [
+        ("", "-- change thumbnail cache layout --"),
+        ("char", "one level by first character"),
+        ("hash", "two levels by hash"),
+    ]
+
     SUBTITLE_SOURCE_CHOICES = [
         ("", "-- change subtitle source settings"),
         ("user", "only download user created"),
@@ -106,6 +112,9 @@ class ApplicationSettingsForm(forms.Form):
     application_enable_cast = forms.ChoiceField(
         widget=forms.Select, choices=CAST_CHOICES, required=False
     )
+    application_thumb_layout = forms.ChoiceField(
+        widget=forms.Select, choices=THUMB_LAYOUT_CHOICES, required=False
+    )
 
 
 class SchedulerSettingsForm(forms.Form):
@@ -0,0 +1,174 @@
+"""
+functionality:
+- stream progress messages to the frontend as server-sent events
+- share a single redis subscription between all connected clients
+- served from the asgi application, /progress/ stays as polling fallback
+"""
+
+import asyncio
+import json
+import threading
+from http.cookies import SimpleCookie
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from home.src.ta.ta_redis import RedisArchivist
+
+
+class ProgressHub:
+    """listen to redis pub/sub in a thread, broadcast to client queues"""
+
+    ACTIVE_TIMEOUT = 1
+    IDLE_TIMEOUT = 30
+
+    def __init__(self):
+        self.clients = set()
+        self.messages = []
+        self.loop = False
+        self.thread = False
+        self.lock = threading.Lock()
+
+    def register(self, client_queue):
+        """add client and start listening if needed"""
+        self.loop = asyncio.get_running_loop()
+        with self.lock:
+            self.clients.add(client_queue)
+            if not self.thread:
+                self.thread = threading.Thread(
+                    target=self._listen, daemon=True
+                )
+                self.thread.start()
+
+    def unregister(self, client_queue):
+        """remove disconnected client"""
+        with self.lock:
+            self.clients.discard(client_queue)
+
+    def _listen(self):
+        """loop forever, refresh messages on publish or while active"""
+        redis_archivist = RedisArchivist()
+        pubsub = redis_archivist.redis_connection.pubsub(
+            ignore_subscribe_messages=True
+        )
+        pubsub.subscribe(redis_archivist.NAME_SPACE + "progress")
+        while True:
+            # poll while messages are active to catch expired keys
+            if self.messages:
+                timeout = self.ACTIVE_TIMEOUT
+            else:
+                timeout = self.IDLE_TIMEOUT
+
+            published = pubsub.get_message(timeout=timeout)
+            if not published and not self.messages:
+                continue
+
+            # coalesce burst of publishes into one lookup
+            while pubsub.get_message(timeout=0):
+                pass
+
+            all_messages = redis_archivist.get_progress()
+            if all_messages != self.messages:
+                self.messages = all_messages
+                self._broadcast(all_messages)
+
+    def _broadcast(self, all_messages):
+        """hand over new messages to all client queues"""
+        with self.lock:
+            for client_queue in self.clients:
+                self.loop.call_soon_threadsafe(
+                    client_queue.put_nowait, all_messages
+                )
+
+
+HUB = ProgressHub()
+
+
+def is_authenticated(scope):
+    """validate session cookie of stream request"""
+    headers = dict(scope["headers"])
+    cookie = SimpleCookie(headers.get(b"cookie", b"").decode())
+    session_cookie = cookie.get(settings.SESSION_COOKIE_NAME)
+    if not session_cookie:
+        return False
+
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(session_cookie.value)
+    return bool(session.get("_auth_user_id"))
+
+
+def format_event(all_messages):
+    """build sse event from list of messages"""
+    data = json.dumps({"messages": all_messages})
+    return f"data: {data}\n\n".encode()
+
+
+async def wait_disconnect(receive):
+    """consume request messages until client goes away"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def progress_stream(scope, receive, send):
+    """resolves to /progress/stream/
+    asgi handler sending progress messages as server-sent events
+    """
+    if not await sync_to_async(is_authenticated)(scope):
+        await send({"type": "http.response.start", "status": 403})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    client_queue = asyncio.Queue()
+    HUB.register(client_queue)
+    initial = await sync_to_async(RedisArchivist().get_progress)()
+    await send(
+        {
+            "type": "http.response.body",
+            "body": format_event(initial),
+            "more_body": True,
+        }
+    )
+
+    disconnect = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        while True:
+            next_messages = asyncio.ensure_future(client_queue.get())
+            done, _ = await asyncio.wait(
+                [next_messages, disconnect],
+                timeout=HUB.IDLE_TIMEOUT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                next_messages.cancel()
+                break
+
+            if next_messages in done:
+                body = format_event(next_messages.result())
+            else:
+                # keep idle connection open through proxies
+                next_messages.cancel()
+                body = b": keepalive\n\n"
+
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": body,
+                    "more_body": True,
+                }
+            )
+    finally:
+        HUB.unregister(client_queue)
+        disconnect.cancel()
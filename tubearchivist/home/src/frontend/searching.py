@@ -119,8 +119,11 @@ class SearchHandler:
 
         if "vid_thumb_url" in hit_keys:
             youtube_id = hit["source"]["youtube_id"]
-            thumb_path = ThumbManager().vid_thumb_path(youtube_id)
+            thumb_handler = ThumbManager()
+            thumb_path = thumb_handler.vid_thumb_path(youtube_id)
             hit["source"]["vid_thumb_url"] = thumb_path
+            srcset = thumb_handler.vid_thumb_srcset(youtube_id)
+            hit["source"]["vid_thumb_srcset"] = srcset
 
         if "channel_last_refresh" in hit_keys:
             refreshed = hit["source"]["channel_last_refresh"]
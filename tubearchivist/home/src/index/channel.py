@@ -10,13 +10,14 @@ import re
 from datetime import datetime
 
 import requests
-import yt_dlp
-from bs4 import BeautifulSoup
+from home.src.download.known_ids import KnownIds
 from home.src.download.thumbnails import ThumbManager
 from home.src.es.connect import ElasticWrap, IndexPaginate
 from home.src.index.generic import YouTubeItem
+from home.src.index.inventory import ArchiveInventory
 from home.src.index.playlist import YoutubePlaylist
 from home.src.ta.helper import clean_string
+from home.src.ta.ratelimit import RateLimiter
 
 
 class ChannelScraper:
@@ -44,12 +45,16 @@ class ChannelScraper:
         print(f"{self.channel_id}: scrape channel data from youtube")
         url = f"https://www.youtube.com/channel/{self.channel_id}/about?hl=en"
         cookies = {"CONSENT": "YES+xxxxxxxxxxxxxxxxxxxxxxxxxxx"}
+        RateLimiter("channel_scrape").acquire()
         response = requests.get(url, cookies=cookies)
         if response.ok:
             channel_page = response.text
         else:
             print(f"{self.channel_id}: failed to extract channel info")
             raise ConnectionError
+
+        from bs4 import BeautifulSoup
+
         self.soup = BeautifulSoup(channel_page, "html.parser")
 
     def _extract_yt_json(self):
@@ -165,19 +170,50 @@ class YoutubeChannel(YouTubeItem):
             self.upload_to_es()
         return
 
+    def build_stub(self, channel_name, upload=False):
+        """get from es or build minimal channel from local metadata
+        returns True if stub got created and needs online enrichment
+        """
+        self.get_from_es()
+        if self.json_data:
+            return False
+
+        self.json_data = {
+            "channel_active": True,
+            # enriched online by enrich_manual_import
+            "channel_last_refresh": int(datetime.now().strftime("%s")),
+            "channel_subs": 0,
+            "channel_name": channel_name,
+            "channel_banner_url": False,
+            "channel_tvart_url": False,
+            "channel_id": self.youtube_id,
+            "channel_subscribed": False,
+            "channel_description": False,
+            "channel_thumb_url": False,
+            "channel_views": 0,
+        }
+        if upload:
+            self.upload_to_es()
+        return True
+
     def get_from_youtube(self):
         """use bs4 to scrape channel about page"""
         self.json_data = ChannelScraper(self.youtube_id).get_json()
         self.get_channel_art()
 
     def get_channel_art(self):
-        """download channel art for new channels"""
+        """queue channel art download, don't block indexing"""
+        from home.tasks import download_channel_art  # circular import
+
         channel_id = self.youtube_id
         channel_thumb = self.json_data["channel_thumb_url"]
         channel_banner = self.json_data["channel_banner_url"]
-        ThumbManager().download_chan(
-            [(channel_id, channel_thumb, channel_banner)]
-        )
+        thumb_handler = ThumbManager()
+        if thumb_handler.queue_channel(
+            channel_id, channel_thumb, channel_banner
+        ):
+            # short delay to batch channels added in a burst
+            download_channel_art.apply_async(countdown=2)
 
     def sync_to_videos(self):
         """sync new channel_dict to all videos of channel"""
@@ -209,9 +245,16 @@ class YoutubeChannel(YouTubeItem):
         data = {
             "query": {
                 "term": {"channel.channel_id": {"value": self.youtube_id}}
-            }
+            },
+            "_source": ["youtube_id"],
+            "sort": [{"_doc": {"order": "asc"}}],
         }
+        all_videos = IndexPaginate("ta_video", data).get_results()
+        data = {"query": data["query"]}
         _, _ = ElasticWrap("ta_video/_delete_by_query").post(data)
+        all_ids = [i["youtube_id"] for i in all_videos]
+        KnownIds().remove(all_ids, kinds=["downloaded"])
+        ThumbManager.request_rescan()
 
     def delete_playlists(self):
         """delete all indexed playlist from es"""
@@ -235,6 +278,8 @@ class YoutubeChannel(YouTubeItem):
         except FileNotFoundError:
             print(f"no videos found for {folder_path}")
 
+        ArchiveInventory().remove_folder(os.path.split(folder_path)[-1])
+
         print(f"{self.youtube_id}: delete indexed playlists")
         self.delete_playlists()
         print(f"{self.youtube_id}: delete indexed videos")
@@ -252,6 +297,9 @@ class YoutubeChannel(YouTubeItem):
             "skip_download": True,
             "extract_flat": True,
         }
+        import yt_dlp
+
+        RateLimiter("yt_extract").acquire()
         playlists = yt_dlp.YoutubeDL(obs).extract_info(url)
         all_entries = [(i["id"], i["title"]) for i in playlists["entries"]]
 
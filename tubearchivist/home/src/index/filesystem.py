@@ -3,6 +3,9 @@ Functionality:
 - reindexing old documents
 - syncing updated values between indexes
 - scan the filesystem to delete or index
+- import media files, offline from local yt-dlp metadata if available
+- remux or transcode imported media files in parallel
+- reconcile index for changed channel folders from archive watcher
 """
 
 import json
@@ -10,16 +13,20 @@ import os
 import re
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 import requests
-from home.src.download.queue import PendingList
+from home.src.download.known_ids import KnownIds
+from home.src.download.thumbnails import ThumbManager
 from home.src.download.yt_dlp_handler import VideoDownloader
+from home.src.es.connect import ElasticWrap, IndexPaginate
+from home.src.index.inventory import ArchiveInventory
 from home.src.index.reindex import Reindex
-from home.src.index.video import index_new_video
+from home.src.index.video import YoutubeVideo, index_new_video
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import clean_string, ignore_filelist
-from home.src.ta.ta_redis import RedisArchivist
+from home.src.ta.ta_redis import RedisArchivist, RedisSet
 
 
 class FilesystemScanner:
@@ -38,35 +45,25 @@ class FilesystemScanner:
         self.to_index = None
         self.to_delete = None
 
-    def get_all_downloaded(self):
+    @staticmethod
+    def get_all_downloaded():
         """get a list of all video files downloaded"""
-        channels = os.listdir(self.VIDEOS)
-        all_channels = ignore_filelist(channels)
-        all_channels.sort()
-        all_downloaded = []
-        for channel_name in all_channels:
-            channel_path = os.path.join(self.VIDEOS, channel_name)
-            channel_files = os.listdir(channel_path)
-            channel_files_clean = ignore_filelist(channel_files)
-            all_videos = [i for i in channel_files_clean if i.endswith(".mp4")]
-            for video in all_videos:
-                youtube_id = video[9:20]
-                all_downloaded.append((channel_name, video, youtube_id))
-
-        return all_downloaded
+        all_files = ArchiveInventory().get_all()
+        return [(i[0], i[1], i[2]) for i in all_files]
 
     @staticmethod
     def get_all_indexed():
-        """get a list of all indexed videos"""
-        index_handler = PendingList()
-        all_indexed_raw = index_handler.get_all_indexed()
-        all_indexed = []
-        for video in all_indexed_raw:
-            youtube_id = video["youtube_id"]
-            media_url = video["media_url"]
-            published = video["published"]
-            title = video["title"]
-            all_indexed.append((youtube_id, media_url, published, title))
+        """get a list of all indexed videos, only fields to compare"""
+        data = {
+            "query": {"match_all": {}},
+            "_source": ["youtube_id", "media_url", "published", "title"],
+            "sort": [{"_doc": {"order": "asc"}}],
+        }
+        all_indexed_raw = IndexPaginate("ta_video", data).get_results()
+        all_indexed = [
+            (i["youtube_id"], i["media_url"], i["published"], i["title"])
+            for i in all_indexed_raw
+        ]
         return all_indexed
 
     def list_comarison(self):
@@ -77,50 +74,39 @@ class FilesystemScanner:
 
     def find_unindexed(self):
         """find video files without a matching document indexed"""
-        all_indexed_ids = [i[0] for i in self.all_indexed]
-        to_index = []
-        for downloaded in self.all_downloaded:
-            if downloaded[2] not in all_indexed_ids:
-                to_index.append(downloaded)
-
-        self.to_index = to_index
+        all_indexed_ids = {i[0] for i in self.all_indexed}
+        self.to_index = [
+            i for i in self.all_downloaded if i[2] not in all_indexed_ids
+        ]
 
     def find_missing(self):
         """find indexed videos without matching media file"""
-        all_downloaded_ids = [i[2] for i in self.all_downloaded]
-        to_delete = []
-        for video in self.all_indexed:
-            youtube_id = video[0]
-            if youtube_id not in all_downloaded_ids:
-                to_delete.append(video)
-
-        self.to_delete = to_delete
+        all_downloaded_ids = {i[2] for i in self.all_downloaded}
+        self.to_delete = [
+            i for i in self.all_indexed if i[0] not in all_downloaded_ids
+        ]
 
     def find_bad_media_url(self):
         """rename media files not matching the indexed title"""
         to_fix = []
         to_rename = []
-        for downloaded in self.all_downloaded:
-            channel, filename, downloaded_id = downloaded
-            # find in indexed
-            for indexed in self.all_indexed:
-                indexed_id, media_url, published, title = indexed
-                if indexed_id == downloaded_id:
-                    # found it
-                    title_c = clean_string(title)
-                    pub = published.replace("-", "")
-                    expected_filename = f"{pub}_{indexed_id}_{title_c}.mp4"
-                    new_url = os.path.join(channel, expected_filename)
-                    if expected_filename != filename:
-                        # file to rename
-                        to_rename.append(
-                            (channel, filename, expected_filename)
-                        )
-                    if media_url != new_url:
-                        # media_url to update in es
-                        to_fix.append((indexed_id, new_url))
-
-                    break
+        indexed_lookup = {i[0]: i for i in self.all_indexed}
+        for channel, filename, downloaded_id in self.all_downloaded:
+            indexed = indexed_lookup.get(downloaded_id)
+            if not indexed:
+                continue
+
+            indexed_id, media_url, published, title = indexed
+            title_c = clean_string(title)
+            pub = published.replace("-", "")
+            expected_filename = f"{pub}_{indexed_id}_{title_c}.mp4"
+            new_url = os.path.join(channel, expected_filename)
+            if expected_filename != filename:
+                # file to rename
+                to_rename.append((channel, filename, expected_filename))
+            if media_url != new_url:
+                # media_url to update in es
+                to_fix.append((indexed_id, new_url))
 
         self.mismatch = to_fix
         self.to_rename = to_rename
@@ -166,6 +152,10 @@ class FilesystemScanner:
             if not request.ok:
                 print(request.text)
 
+        all_deleted = [i[0] for i in self.to_delete]
+        KnownIds().remove(all_deleted, kinds=["downloaded"])
+        ThumbManager.track_deleted(all_deleted)
+
 
 class ManualImport:
     """import and indexing existing video files"""
@@ -173,6 +163,22 @@ class ManualImport:
     CONFIG = AppConfig().config
     CACHE_DIR = CONFIG["application"]["cache_dir"]
     IMPORT_DIR = os.path.join(CACHE_DIR, "import")
+    THUMB_EXT = [".jpg", ".webp", ".png"]
+    SIDECAR_EXT = tuple(THUMB_EXT + [".json", ".vtt"])
+    # codecs playable in browser from mp4 container, copy without encoding
+    COPY_CODECS = {
+        "video": ["h264", "vp9", "av1"],
+        "audio": ["aac", "opus", "mp3"],
+    }
+    TRANSCODE = {
+        "video": ["libx264", "-crf", "22", "-preset", "fast"],
+        "audio": ["aac", "-b:a", "160k"],
+    }
+    # ffmpeg is multithreaded, split cores between parallel conversions
+    IMPORT_WORKERS = int(os.environ.get("TA_IMPORT_WORKERS") or 2)
+    FFMPEG_THREADS = max(1, (os.cpu_count() or 2) // IMPORT_WORKERS)
+    ENRICH_VIDEOS = "import:enrich_videos"
+    ENRICH_CHANNELS = "import:enrich_channels"
 
     def __init__(self):
         self.identified = self.import_folder_parser()
@@ -182,7 +188,12 @@ class ManualImport:
         import_files = os.listdir(self.IMPORT_DIR)
         to_import = ignore_filelist(import_files)
         to_import.sort()
-        video_files = [i for i in to_import if not i.endswith(".json")]
+        video_files = [
+            i for i in to_import if not i.endswith(self.SIDECAR_EXT)
+        ]
+        # lookups by name, avoid scanning folder per video
+        import_set = set(to_import)
+        all_subtitles = self._group_subtitles(to_import)
 
         identified = []
 
@@ -191,24 +202,64 @@ class ManualImport:
             file_dict = {"video_file": file_path}
             file_name, _ = os.path.splitext(file_path)
 
-            matching_json = [
-                i
-                for i in to_import
-                if i.startswith(file_name) and i.endswith(".json")
-            ]
-            if matching_json:
-                json_file = matching_json[0]
+            json_file = self._find_json(file_name, import_set, to_import)
+            if json_file:
                 youtube_id = self.extract_id_from_json(json_file)
                 file_dict.update({"json_file": json_file})
             else:
                 youtube_id = self.extract_id_from_filename(file_name)
                 file_dict.update({"json_file": False})
 
-            file_dict.update({"youtube_id": youtube_id})
+            file_dict.update(
+                {
+                    "youtube_id": youtube_id,
+                    "thumb_file": self._find_thumb(file_name, import_set),
+                    "subtitles": all_subtitles.get(file_name, []),
+                }
+            )
             identified.append(file_dict)
 
         return identified
 
+    @staticmethod
+    def _find_json(file_name, import_set, to_import):
+        """find matching json, exact yt-dlp names first"""
+        for json_file in [f"{file_name}.info.json", f"{file_name}.json"]:
+            if json_file in import_set:
+                return json_file
+
+        matching_json = [
+            i
+            for i in to_import
+            if i.startswith(file_name) and i.endswith(".json")
+        ]
+        if matching_json:
+            return matching_json[0]
+
+        return False
+
+    def _find_thumb(self, file_name, import_set):
+        """find thumbnail written next to media file by yt-dlp"""
+        for ext in self.THUMB_EXT:
+            if file_name + ext in import_set:
+                return file_name + ext
+
+        return False
+
+    @staticmethod
+    def _group_subtitles(to_import):
+        """group subtitles named <file_name>.<lang>.vtt by file_name"""
+        all_subtitles = {}
+        for import_file in to_import:
+            parts = import_file.rsplit(".", 2)
+            if not import_file.endswith(".vtt") or len(parts) != 3:
+                continue
+
+            file_name, lang, _ = parts
+            all_subtitles.setdefault(file_name, []).append((lang, import_file))
+
+        return all_subtitles
+
     @staticmethod
     def extract_id_from_filename(file_name):
         """
@@ -234,37 +285,144 @@ class ManualImport:
         return youtube_id
 
     def process_import(self):
-        """go through identified media files"""
-
+        """go through identified media files
+        convert in parallel, index in order of conversions finished
+        returns list of videos where thumbnail still needs downloading
+        """
         all_videos_added = []
 
-        for media_file in self.identified:
-            json_file = media_file["json_file"]
-            video_file = media_file["video_file"]
-            youtube_id = media_file["youtube_id"]
+        with ThreadPoolExecutor(self.IMPORT_WORKERS) as pool:
+            futures = {}
+            for media_file in self.identified:
+                video_path = os.path.join(
+                    self.IMPORT_DIR, media_file["video_file"]
+                )
+                future = pool.submit(
+                    self.move_to_cache, video_path, media_file["youtube_id"]
+                )
+                futures[future] = media_file
+
+            for future in as_completed(futures):
+                media_file = futures[future]
+                try:
+                    cache_path = future.result()
+                except (subprocess.CalledProcessError, OSError):
+                    print(f"failed to convert {media_file['video_file']}")
+                    continue
+
+                try:
+                    missing_thumb = self._index_imported(media_file)
+                except Exception as err:  # pylint: disable=broad-except
+                    # don't abort, other files are already in cache
+                    print(f"failed to index {media_file['video_file']}: {err}")
+                    self._restore_import(media_file, cache_path)
+                    continue
+
+                if missing_thumb:
+                    all_videos_added.append(missing_thumb)
 
-            video_path = os.path.join(self.CACHE_DIR, "import", video_file)
+        return all_videos_added
 
-            self.move_to_cache(video_path, youtube_id)
+    def _index_imported(self, media_file):
+        """index and archive media file moved to cache
+        returns (youtube_id, thumb_url) if thumbnail needs downloading
+        """
+        json_file = media_file["json_file"]
+        youtube_id = media_file["youtube_id"]
 
-            # identify and archive
+        # identify and archive
+        if json_file:
+            vid_dict = self._index_offline(media_file)
+        else:
             vid_dict = index_new_video(youtube_id)
             VideoDownloader([youtube_id]).move_to_archive(vid_dict)
-            youtube_id = vid_dict["youtube_id"]
-            thumb_url = vid_dict["vid_thumb_url"]
-            all_videos_added.append((youtube_id, thumb_url))
 
-            # cleanup
-            if os.path.exists(video_path):
-                os.remove(video_path)
-            if json_file:
-                json_path = os.path.join(self.CACHE_DIR, "import", json_file)
-                os.remove(json_path)
+        # cleanup
+        to_clean = [media_file["video_file"], json_file]
+        to_clean += [media_file["thumb_file"]]
+        to_clean += [i[1] for i in media_file["subtitles"]]
+        for import_file in [i for i in to_clean if i]:
+            import_path = os.path.join(self.IMPORT_DIR, import_file)
+            if os.path.exists(import_path):
+                os.remove(import_path)
+
+        if json_file and media_file["thumb_file"]:
+            return False
+
+        return (youtube_id, vid_dict["vid_thumb_url"])
+
+    def _restore_import(self, media_file, cache_path):
+        """undo move to cache of media file failed to index"""
+        if not os.path.exists(cache_path):
+            return
+
+        video_path = os.path.join(self.IMPORT_DIR, media_file["video_file"])
+        if os.path.exists(video_path):
+            # converted, original still in import folder
+            os.remove(cache_path)
+        else:
+            shutil.move(cache_path, video_path)
 
-        return all_videos_added
+    def _index_offline(self, media_file):
+        """index from local info json, defer online refresh"""
+        youtube_id = media_file["youtube_id"]
+        json_path = os.path.join(self.IMPORT_DIR, media_file["json_file"])
+        with open(json_path, "r", encoding="utf-8") as f:
+            youtube_meta = json.loads(f.read())
+
+        video = YoutubeVideo(youtube_id)
+        channel_stub = video.build_json_offline(youtube_meta)
+        VideoDownloader([youtube_id]).move_to_archive(video.json_data)
+        self._archive_subtitles(video, media_file["subtitles"])
+
+        thumb_file = media_file["thumb_file"]
+        if thumb_file:
+            ThumbManager().import_vid_thumb(
+                youtube_id,
+                os.path.join(self.IMPORT_DIR, thumb_file),
+                video.json_data["vid_thumb_url"],
+            )
+            video.add_thumb_lqip()
+
+        video.upload_to_es()
+        RedisSet(self.ENRICH_VIDEOS).add([youtube_id])
+        if channel_stub:
+            RedisSet(self.ENRICH_CHANNELS).add([video.channel_id])
+
+        return video.json_data
+
+    def _archive_subtitles(self, video, subtitles):
+        """move local vtt subtitles next to archived media file"""
+        if not subtitles:
+            return
+
+        videos_base = self.CONFIG["application"]["videos"]
+        user_langs = video.youtube_meta.get("subtitles") or {}
+        all_subtitles = []
+        for lang, subtitle_file in subtitles:
+            media_url = video.json_data["media_url"].replace(
+                ".mp4", f"-{lang}.vtt"
+            )
+            shutil.move(
+                os.path.join(self.IMPORT_DIR, subtitle_file),
+                os.path.join(videos_base, media_url),
+            )
+            all_subtitles.append(
+                {
+                    "ext": "vtt",
+                    "lang": lang,
+                    "name": lang,
+                    "source": "user" if lang in user_langs else "auto",
+                    "media_url": media_url,
+                }
+            )
+
+        video.json_data["subtitles"] = all_subtitles
 
     def move_to_cache(self, video_path, youtube_id):
-        """move identified video file to cache, convert to mp4"""
+        """move identified video file to cache, convert to mp4
+        returns path of media file in cache
+        """
         file_name = os.path.split(video_path)[-1]
         video_file, ext = os.path.splitext(file_name)
 
@@ -272,27 +430,71 @@ class ManualImport:
         if youtube_id not in video_file:
             video_file = f"{video_file}_{youtube_id}"
 
+        new_file = video_file + ".mp4"
+        dest_path = os.path.join(self.CACHE_DIR, "download", new_file)
+
         # move, convert if needed
         if ext == ".mp4":
-            new_file = video_file + ext
-            dest_path = os.path.join(self.CACHE_DIR, "download", new_file)
             shutil.move(video_path, dest_path)
-        else:
-            print(f"processing with ffmpeg: {video_file}")
-            new_file = video_file + ".mp4"
-            dest_path = os.path.join(self.CACHE_DIR, "download", new_file)
+            return dest_path
+
+        codec_args = self._get_codec_args(video_path)
+        print(f"processing with ffmpeg: {video_file} {codec_args}")
+        # write to temp file, don't leave broken mp4 in cache on failure
+        temp_path = dest_path + ".part"
+        try:
             subprocess.run(
-                [
-                    "ffmpeg",
-                    "-i",
-                    video_path,
-                    dest_path,
-                    "-loglevel",
-                    "warning",
-                    "-stats",
-                ],
+                ["ffmpeg", "-y", "-loglevel", "warning", "-i", video_path]
+                + ["-map", "0:v:0", "-map", "0:a?"]
+                + codec_args
+                + ["-threads", str(self.FFMPEG_THREADS)]
+                + ["-movflags", "+faststart", "-f", "mp4", temp_path],
                 check=True,
             )
+        except subprocess.CalledProcessError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        os.replace(temp_path, dest_path)
+        return dest_path
+
+    def _get_codec_args(self, video_path):
+        """stream copy compatible codecs, transcode only what's needed"""
+        codecs = self.probe_codecs(video_path)
+        codec_args = []
+        for codec_type, transcode in self.TRANSCODE.items():
+            stream_codecs = codecs.get(codec_type, [])
+            if all(i in self.COPY_CODECS[codec_type] for i in stream_codecs):
+                codec_args += [f"-c:{codec_type[0]}", "copy"]
+            else:
+                codec_args += [f"-c:{codec_type[0]}"] + transcode
+
+        return codec_args
+
+    @staticmethod
+    def probe_codecs(video_path):
+        """get codec names of all streams by codec_type"""
+        probe = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "stream=codec_type,codec_name",
+                "-of",
+                "json",
+                video_path,
+            ],
+            capture_output=True,
+            check=True,
+        )
+        codecs = {}
+        for stream in json.loads(probe.stdout.decode()).get("streams", []):
+            codec_type = stream.get("codec_type")
+            codecs.setdefault(codec_type, []).append(stream.get("codec_name"))
+
+        return codecs
 
 
 def scan_filesystem():
@@ -315,6 +517,58 @@ def scan_filesystem():
             index_new_video(youtube_id)
 
 
+def reconcile_folders(channel_folders):
+    """update index for media files changed in channel_folders only"""
+    inventory = ArchiveInventory()
+    before = inventory.get_files(channel_folders)
+    inventory.refresh(channel_folders=channel_folders)
+    after = inventory.get_files(channel_folders)
+    # moved to folder outside of this batch
+    all_ids = set(inventory.get_ids(refresh=False))
+
+    to_delete = [i for i in before if i not in after and i not in all_ids]
+    for youtube_id in to_delete:
+        print(f"{youtube_id}: media file removed, deleting from index")
+        _, _ = ElasticWrap(f"ta_video/_doc/{youtube_id}").delete()
+
+    if to_delete:
+        KnownIds().remove(to_delete, kinds=["downloaded"])
+        ThumbManager.track_deleted(to_delete)
+
+    missing_thumbs = []
+    for youtube_id, media_url in after.items():
+        if before.get(youtube_id) == media_url:
+            continue
+
+        response, status_code = ElasticWrap(
+            f"ta_video/_doc/{youtube_id}"
+        ).get()
+        if status_code == 200:
+            if response["_source"]["media_url"] != media_url:
+                print(f"{youtube_id}: media file moved to {media_url}")
+                data = {"doc": {"media_url": media_url}}
+                _, _ = ElasticWrap(f"ta_video/_update/{youtube_id}").post(data)
+            continue
+
+        print(f"{youtube_id}: new media file, index video")
+        try:
+            vid_dict = index_new_video(youtube_id)
+        except ValueError:
+            # not available on youtube
+            continue
+        except Exception as err:  # pylint: disable=broad-except
+            # maybe incomplete, drop from inventory to retry on next change
+            print(f"{youtube_id}: failed to index, retry later: {err}")
+            inventory.remove_file(media_url)
+            inventory.forget_folder(os.path.split(media_url)[0])
+            continue
+
+        missing_thumbs.append((youtube_id, vid_dict["vid_thumb_url"]))
+
+    if missing_thumbs:
+        ThumbManager().download_vid(missing_thumbs, notify=False)
+
+
 def reindex_old_documents():
     """daily refresh of old documents"""
     # continue if needed
@@ -324,3 +578,17 @@ def reindex_old_documents():
     # set timestamp
     now = int(datetime.now().strftime("%s"))
     RedisArchivist().set_message("last_reindex", now, expire=False)
+
+
+def enrich_imported():
+    """refresh documents imported offline with data from youtube"""
+    # channels first, video refresh keeps synced channel dict
+    channel_set = RedisSet(ManualImport.ENRICH_CHANNELS)
+    for channel_id in channel_set.get_all():
+        Reindex.reindex_single_channel(channel_id)
+        channel_set.remove([channel_id])
+
+    video_set = RedisSet(ManualImport.ENRICH_VIDEOS)
+    for youtube_id in video_set.get_all():
+        Reindex.reindex_single_video(youtube_id)
+        video_set.remove([youtube_id])
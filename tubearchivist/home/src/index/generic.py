@@ -5,9 +5,9 @@ functionality:
 
 import math
 
-import yt_dlp
 from home.src.es.connect import ElasticWrap
 from home.src.ta.config import AppConfig
+from home.src.ta.ratelimit import RateLimiter
 from home.src.ta.ta_redis import RedisArchivist
 
 
@@ -41,6 +41,9 @@ class YouTubeItem:
     def get_from_youtube(self):
         """use yt-dlp to get meta data from youtube"""
         print(f"{self.youtube_id}: get metadata from youtube")
+        import yt_dlp
+
+        RateLimiter("yt_extract").acquire()
         try:
             yt_item = yt_dlp.YoutubeDL(self.yt_obs)
             response = yt_item.extract_info(self.yt_base + self.youtube_id)
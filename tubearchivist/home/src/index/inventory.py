@@ -0,0 +1,185 @@
+"""
+functionality:
+- keep inventory of media files in archive in redis
+- only list channel folders again where the folder mtime changed
+- update directly on archive and delete
+- detect changed channel folders for archive watcher
+"""
+
+import json
+import os
+
+from home.src.ta.config import AppConfig
+from home.src.ta.helper import ignore_filelist
+from home.src.ta.ta_redis import RedisArchivist
+
+
+class ArchiveInventory:
+    """media files in archive, refreshed by folder mtime"""
+
+    FOLDERS_KEY = "inventory:folders"
+    FILES_KEY = "inventory:files:"
+
+    def __init__(self):
+        self.videos = AppConfig().config["application"]["videos"]
+        self.conn = RedisArchivist().redis_connection
+        self.name_space = RedisArchivist.NAME_SPACE
+
+    def refresh(self, channel_folders=False):
+        """list channel folders changed since last refresh
+        or force listing of channel_folders if passed
+        """
+        known = self._get_known_folders()
+        current = self._get_current_folders()
+
+        pipeline = self.conn.pipeline()
+        for channel_name in set(known) - set(current):
+            pipeline.execute_command("HDEL", self._key(), channel_name)
+            pipeline.execute_command("DEL", self._key(channel_name))
+
+        if channel_folders:
+            changed = [i for i in channel_folders if i in current]
+        else:
+            changed = [i for i in current if current[i] != known.get(i)]
+
+        for channel_name in changed:
+            # mtime from before listing, changes while listing trigger again
+            all_files = self._list_folder(channel_name)
+            pipeline.execute_command("DEL", self._key(channel_name))
+            if all_files:
+                pipeline.execute_command(
+                    "HSET", self._key(channel_name), *all_files
+                )
+            pipeline.execute_command(
+                "HSET", self._key(), channel_name, current[channel_name]
+            )
+
+        pipeline.execute()
+        if changed:
+            print(f"inventory: refreshed {len(changed)} channel folders")
+
+    def get_changed_folders(self):
+        """get channel folders changed or removed since last refresh"""
+        known = self._get_known_folders()
+        current = self._get_current_folders()
+        changed = {i for i in current if current[i] != known.get(i)}
+        return sorted(changed | (set(known) - set(current)))
+
+    def _get_current_folders(self):
+        """get channel folders in archive with mtime"""
+        with os.scandir(self.videos) as channels:
+            current = {
+                i.name: str(i.stat().st_mtime_ns)
+                for i in channels
+                if i.is_dir() and ignore_filelist([i.name])
+            }
+
+        return current
+
+    def _get_known_folders(self):
+        """get channel folders with mtime of last listing"""
+        reply = self.conn.execute_command("HGETALL", self._key())
+        folders = dict(zip(reply[::2], reply[1::2]))
+        return {key.decode(): value.decode() for key, value in folders.items()}
+
+    def _list_folder(self, channel_name):
+        """get flat list of filename, file json of media files in folder"""
+        channel_path = os.path.join(self.videos, channel_name)
+        all_files = []
+        with os.scandir(channel_path) as channel_files:
+            for entry in channel_files:
+                if not entry.name.endswith(".mp4"):
+                    continue
+                if not ignore_filelist([entry.name]):
+                    continue
+
+                all_files.extend([entry.name, self._file_json(entry.stat())])
+
+        return all_files
+
+    @staticmethod
+    def _file_json(stat_result):
+        """serialize size and mtime of file"""
+        return json.dumps(
+            {"size": stat_result.st_size, "mtime": int(stat_result.st_mtime)}
+        )
+
+    def _key(self, channel_name=False):
+        """redis key of folder list or files of channel folder"""
+        if channel_name:
+            return self.name_space + self.FILES_KEY + channel_name
+
+        return self.name_space + self.FOLDERS_KEY
+
+    def get_all(self, refresh=True):
+        """get list of (channel_name, filename, youtube_id, size, mtime)"""
+        if refresh:
+            self.refresh()
+
+        all_channels = sorted(self._get_known_folders())
+        pipeline = self.conn.pipeline()
+        for channel_name in all_channels:
+            pipeline.execute_command("HGETALL", self._key(channel_name))
+
+        all_files = []
+        for channel_name, reply in zip(all_channels, pipeline.execute()):
+            for filename, file_json in zip(reply[::2], reply[1::2]):
+                filename = filename.decode()
+                file_dict = json.loads(file_json)
+                all_files.append(
+                    (
+                        channel_name,
+                        filename,
+                        filename[9:20],
+                        file_dict["size"],
+                        file_dict["mtime"],
+                    )
+                )
+
+        return all_files
+
+    def get_ids(self, refresh=True):
+        """get list of youtube ids of all media files"""
+        return [i[2] for i in self.get_all(refresh=refresh)]
+
+    def get_files(self, channel_folders):
+        """get dict of youtube_id: media_url in channel_folders"""
+        pipeline = self.conn.pipeline()
+        for channel_name in channel_folders:
+            pipeline.execute_command("HKEYS", self._key(channel_name))
+
+        all_files = {}
+        for channel_name, reply in zip(channel_folders, pipeline.execute()):
+            for filename in reply:
+                filename = filename.decode()
+                media_url = os.path.join(channel_name, filename)
+                all_files[filename[9:20]] = media_url
+
+        return all_files
+
+    def add_file(self, media_url):
+        """add media file at media_url, relative to archive"""
+        channel_name, filename = os.path.split(media_url)
+        file_path = os.path.join(self.videos, media_url)
+        self.conn.execute_command(
+            "HSET",
+            self._key(channel_name),
+            filename,
+            self._file_json(os.stat(file_path)),
+        )
+
+    def remove_file(self, media_url):
+        """remove media file at media_url, relative to archive"""
+        channel_name, filename = os.path.split(media_url)
+        self.conn.execute_command("HDEL", self._key(channel_name), filename)
+
+    def forget_folder(self, channel_name):
+        """list channel folder again on next refresh"""
+        self.conn.execute_command("HDEL", self._key(), channel_name)
+
+    def remove_folder(self, channel_name):
+        """remove deleted channel folder"""
+        pipeline = self.conn.pipeline()
+        pipeline.execute_command("HDEL", self._key(), channel_name)
+        pipeline.execute_command("DEL", self._key(channel_name))
+        pipeline.execute()
@@ -46,7 +46,7 @@ class YoutubePlaylist(YouTubeItem):
             self.process_youtube_meta()
             self.get_entries()
             self.json_data["playlist_entries"] = self.all_members
-            self.get_playlist_art()
+            self.queue_playlist_art()
             self.json_data["playlist_subscribed"] = subscribed
 
     def process_youtube_meta(self):
@@ -86,12 +86,10 @@ class YoutubePlaylist(YouTubeItem):
 
         self.all_members = all_members
 
-    @staticmethod
-    def get_playlist_art():
-        """download artwork of playlist"""
-        thumbnails = ThumbManager()
-        missing_playlists = thumbnails.get_missing_playlists()
-        thumbnails.download_playlist(missing_playlists)
+    def queue_playlist_art(self):
+        """queue artwork, downloaded in batch at the end of the run"""
+        playlist_thumb = self.json_data["playlist_thumbnail"]
+        ThumbManager().queue_playlist(self.youtube_id, playlist_thumb)
 
     def add_vids_to_playlist(self):
         """sync the playlist id to videos"""
@@ -7,7 +7,6 @@ functionality:
 import json
 from datetime import datetime
 from math import ceil
-from time import sleep
 
 import requests
 from home.src.download.queue import PendingList
@@ -26,7 +25,6 @@ class Reindex:
     def __init__(self):
         # config
         config = AppConfig().config
-        self.sleep_interval = config["downloads"]["sleep_interval"]
         self.es_url = config["application"]["es_url"]
         self.es_auth = config["application"]["es_auth"]
         self.refresh_interval = config["scheduler"]["check_reindex_days"]
@@ -172,7 +170,6 @@ class Reindex:
 
     def rescrape_all_channels(self):
         """sync new data from channel to all matching videos"""
-        sleep_interval = self.sleep_interval
         channel_sub_handler = ChannelSubscription()
         all_channels = channel_sub_handler.get_channels(subscribed_only=False)
         all_channel_ids = [i["channel_id"] for i in all_channels]
@@ -185,9 +182,6 @@ class Reindex:
             channel.upload_to_es()
             channel.sync_to_videos()
 
-            if sleep_interval:
-                sleep(sleep_interval)
-
     @staticmethod
     def reindex_single_video(youtube_id):
         """refresh data for single video"""
@@ -199,6 +193,7 @@ class Reindex:
         date_downloaded = video.json_data["date_downloaded"]
         channel_dict = video.json_data["channel"]
         playlist = video.json_data.get("playlist")
+        subtitles = video.json_data.get("subtitles")
 
         # get new
         video.build_json()
@@ -213,13 +208,15 @@ class Reindex:
         video.json_data["channel"] = channel_dict
         if playlist:
             video.json_data["playlist"] = playlist
+        if subtitles and "subtitles" not in video.json_data:
+            # keep subtitle files imported from local archive
+            video.json_data["subtitles"] = subtitles
 
-        video.upload_to_es()
+        thumb_url = video.json_data["vid_thumb_url"]
+        ThumbManager().refresh_vid_thumb(youtube_id, thumb_url)
+        video.add_thumb_lqip()
 
-        thumb_handler = ThumbManager()
-        thumb_handler.delete_vid_thumb(youtube_id)
-        to_download = (youtube_id, video.json_data["vid_thumb_url"])
-        thumb_handler.download_vid([to_download], notify=False)
+        video.upload_to_es()
         return
 
     @staticmethod
@@ -255,14 +252,10 @@ class Reindex:
         print(f"reindexing {len(self.all_youtube_ids)} videos")
         for youtube_id in self.all_youtube_ids:
             self.reindex_single_video(youtube_id)
-            if self.sleep_interval:
-                sleep(self.sleep_interval)
         # channels
         print(f"reindexing {len(self.all_channel_ids)} channels")
         for channel_id in self.all_channel_ids:
             self.reindex_single_channel(channel_id)
-            if self.sleep_interval:
-                sleep(self.sleep_interval)
         # playlist
         print(f"reindexing {len(self.all_playlist_ids)} playlists")
         if self.all_playlist_ids:
@@ -270,5 +263,5 @@ class Reindex:
             all_indexed_ids = [i["youtube_id"] for i in all_indexed]
             for playlist_id in self.all_playlist_ids:
                 self.reindex_single_playlist(playlist_id, all_indexed_ids)
-                if self.sleep_interval:
-                    sleep(self.sleep_interval)
+
+            ThumbManager().download_queued_playlists()
@@ -9,10 +9,17 @@ import os
 from datetime import datetime
 
 import requests
+from home.src.download.known_ids import KnownIds
 from home.src.es.connect import ElasticWrap
 from home.src.index import channel as ta_channel
 from home.src.index.generic import YouTubeItem
-from home.src.ta.helper import DurationConverter, clean_string
+from home.src.index.inventory import ArchiveInventory
+from home.src.ta.helper import (
+    DurationConverter,
+    MediaProbe,
+    clean_string,
+)
+from home.src.ta.ratelimit import RateLimiter
 from ryd_client import ryd_client
 
 
@@ -115,6 +122,7 @@ class YoutubeSubtitle:
             dest_path = os.path.join(videos_base, subtitle["media_url"])
             source = subtitle["source"]
             lang = subtitle.get("lang")
+            RateLimiter("yt_extract").acquire()
             response = requests.get(subtitle["url"])
             if not response.ok:
                 print(f"{self.video.youtube_id}: failed to download subtitle")
@@ -302,6 +310,20 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
 
         return
 
+    def build_json_offline(self, youtube_meta):
+        """build json dict from local yt-dlp info json without requests
+        returns True if channel stub got created and needs enrichment
+        """
+        self.youtube_meta = youtube_meta
+        self._process_youtube_meta()
+        channel_name = youtube_meta.get("channel") or youtube_meta["uploader"]
+        channel_stub = self._add_channel(channel_name=channel_name)
+        self._add_stats()
+        self.add_file_path()
+        self.add_player()
+
+        return channel_stub
+
     def _process_youtube_meta(self):
         """extract relevant fields from youtube"""
         # extract
@@ -324,24 +346,32 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
             "active": True,
         }
 
-    def _add_channel(self):
-        """add channel dict to video json_data"""
+    def _add_channel(self, channel_name=False):
+        """add channel dict to video json_data
+        stub from channel_name instead of scraping if passed
+        """
         channel = ta_channel.YoutubeChannel(self.channel_id)
-        channel.build_json(upload=True)
+        channel_stub = False
+        if channel_name:
+            channel_stub = channel.build_stub(channel_name, upload=True)
+        else:
+            channel.build_json(upload=True)
         self.json_data.update({"channel": channel.json_data})
+        return channel_stub
 
     def _add_stats(self):
         """add stats dicst to json_data"""
         # likes
         like_count = self.youtube_meta.get("like_count", 0)
         dislike_count = self.youtube_meta.get("dislike_count", 0)
+        average_rating = self.youtube_meta.get("average_rating")
         self.json_data.update(
             {
                 "stats": {
                     "view_count": self.youtube_meta["view_count"],
                     "like_count": like_count,
                     "dislike_count": dislike_count,
-                    "average_rating": self.youtube_meta["average_rating"],
+                    "average_rating": average_rating,
                 }
             }
         )
@@ -359,7 +389,7 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
         raise FileNotFoundError
 
     def add_player(self):
-        """add player information for new videos"""
+        """add player and stream information for new videos"""
         try:
             # when indexing from download task
             vid_path = self.build_dl_cache_path()
@@ -375,9 +405,10 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
             else:
                 raise FileNotFoundError("could not find video file") from err
 
-        duration_handler = DurationConverter()
-        duration = duration_handler.get_sec(vid_path)
-        duration_str = duration_handler.get_str(duration)
+        media_info = MediaProbe(vid_path).get_info()
+        duration = media_info.pop("duration")
+        duration_str = DurationConverter().get_str(duration)
+        self.json_data["streams"] = media_info
         self.json_data.update(
             {
                 "player": {
@@ -418,13 +449,45 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
             file_path = os.path.join(video_base, media_url)
             os.remove(file_path)
 
+        ArchiveInventory().remove_file(self.json_data.get("media_url"))
+        KnownIds().remove([self.youtube_id], kinds=["downloaded"])
+
         self.del_in_es()
         self.delete_subtitles()
+        self._track_thumb(deleted=True)
+
+    def upload_to_es(self):
+        """add json_data to elastic, track for thumbnail validation"""
+        super().upload_to_es()
+        KnownIds().add([self.youtube_id], "downloaded")
+        self._track_thumb()
+
+    def add_thumb_lqip(self):
+        """add tiny placeholder built from cached thumbnail"""
+        from home.src.download.thumbnails import (  # circular import
+            ThumbManager,
+        )
+
+        lqip = ThumbManager().get_lqip(self.youtube_id)
+        if lqip:
+            self.json_data["vid_thumb_lqip"] = lqip
+
+    def _track_thumb(self, deleted=False):
+        """register change for incremental thumbnail validation"""
+        from home.src.download.thumbnails import (  # circular import
+            ThumbManager,
+        )
+
+        if deleted:
+            ThumbManager.track_deleted([self.youtube_id])
+        else:
+            ThumbManager.track_added([self.youtube_id])
 
     def _get_ryd_stats(self):
         """get optional stats from returnyoutubedislikeapi.com"""
         try:
             print(f"{self.youtube_id}: get ryd stats")
+            RateLimiter("ryd").acquire()
             result = ryd_client.get(self.youtube_id)
         except requests.exceptions.ConnectionError:
             print(f"{self.youtube_id}: failed to query ryd api, skipping")
@@ -462,5 +525,6 @@ def index_new_video(youtube_id):
     if not video.json_data:
         raise ValueError("failed to get metadata for " + youtube_id)
 
+    video.add_thumb_lqip()
     video.upload_to_es()
     return video.json_data
@@ -0,0 +1,183 @@
+"""
+functionality:
+- watch archive for changed media files with inotify
+- fall back to polling channel folder mtimes for network mounts
+- debounce changes and queue changed channel folders for reconcile
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from time import sleep, time
+
+from home.src.index.inventory import ArchiveInventory
+from home.src.ta.config import AppConfig
+from home.src.ta.helper import ignore_filelist
+from home.src.ta.ta_redis import RedisSet
+
+
+class Inotify:
+    """minimal inotify binding over libc, linux only"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    # complete files only, a created file might still be copied
+    FILE_MASK = (
+        IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_DELETE
+        | IN_DELETE_SELF
+    )
+    # archive root, new channel folders need a watch right away
+    ROOT_MASK = FILE_MASK | IN_CREATE
+    EVENT_HEADER = struct.calcsize("iIII")
+
+    def __init__(self):
+        libc_path = ctypes.util.find_library("c")
+        if not libc_path:
+            raise OSError("libc not found")
+
+        self.libc = ctypes.CDLL(libc_path, use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        self.watches = {}
+
+    def add_watch(self, path, name, mask=FILE_MASK):
+        """watch directory, events get reported with name"""
+        watch = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if watch < 0:
+            raise OSError(ctypes.get_errno(), f"failed to watch {path}")
+
+        self.watches[watch] = name
+
+    def read_events(self, timeout):
+        """get list of (watch name, mask, file name), wait for timeout"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, length = struct.unpack_from("iIII", data, offset)
+            start = offset + self.EVENT_HEADER
+            end = start + length
+            name = data[start:end].rstrip(b"\0").decode(errors="ignore")
+            events.append((self.watches.get(watch), mask, name))
+            offset = end
+
+        return events
+
+
+class ArchiveWatcher:
+    """queue changed channel folders for reconcile"""
+
+    CHANGED_KEY = "watcher:changed"
+    DEBOUNCE = 5
+    MAX_DELAY = 60
+    POLL_INTERVAL = int(os.environ.get("TA_WATCHER_INTERVAL") or 60)
+
+    def __init__(self):
+        self.videos = AppConfig().config["application"]["videos"]
+
+    def run(self):
+        """watch forever with inotify or polling"""
+        if os.environ.get("TA_WATCHER_POLL") == "true":
+            self.watch_polling()
+            return
+
+        try:
+            inotify = self._setup_inotify()
+        except OSError as err:
+            print(f"archive watcher: {err}, fall back to polling")
+            self.watch_polling()
+            return
+
+        self.watch_inotify(inotify)
+
+    def _setup_inotify(self):
+        """watch archive root and all channel folders"""
+        inotify = Inotify()
+        inotify.add_watch(self.videos, False, mask=Inotify.ROOT_MASK)
+        for channel_name in ignore_filelist(os.listdir(self.videos)):
+            channel_path = os.path.join(self.videos, channel_name)
+            if os.path.isdir(channel_path):
+                inotify.add_watch(channel_path, channel_name)
+
+        return inotify
+
+    def watch_inotify(self, inotify):
+        """collect events, queue when quiet for debounce time
+        or after max delay on constant activity
+        """
+        print(f"archive watcher: watching {len(inotify.watches)} folders")
+        changed = set()
+        first_change = last_event = 0
+        while True:
+            events = inotify.read_events(timeout=self.DEBOUNCE)
+            for channel_name, mask, name in events:
+                if mask & Inotify.IN_Q_OVERFLOW:
+                    # lost events, compare folder mtimes instead
+                    changed.update(ArchiveInventory().get_changed_folders())
+                elif channel_name is False:
+                    self._root_event(inotify, mask, name, changed)
+                elif mask & Inotify.IN_DELETE_SELF:
+                    changed.add(channel_name)
+                elif mask & Inotify.FILE_MASK and name.endswith(".mp4"):
+                    changed.add(channel_name)
+
+            now = time()
+            if events:
+                last_event = now
+            if not changed:
+                first_change = now
+                continue
+
+            quiet = now - last_event >= self.DEBOUNCE
+            if quiet or now - first_change >= self.MAX_DELAY:
+                self.queue_changed(changed)
+                changed = set()
+
+    def _root_event(self, inotify, mask, name, changed):
+        """channel folder added or removed in archive root"""
+        if not mask & Inotify.IN_ISDIR or not ignore_filelist([name]):
+            return
+
+        changed.add(name)
+        if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+            try:
+                inotify.add_watch(os.path.join(self.videos, name), name)
+            except OSError as err:
+                # folder gone again, reconcile still runs for changed
+                print(f"archive watcher: failed to watch {name}: {err}")
+
+    def watch_polling(self):
+        """compare channel folder mtimes with inventory"""
+        print(f"archive watcher: polling every {self.POLL_INTERVAL}s")
+        inventory = ArchiveInventory()
+        while True:
+            changed = inventory.get_changed_folders()
+            if changed:
+                self.queue_changed(changed)
+
+            sleep(self.POLL_INTERVAL)
+
+    def queue_changed(self, changed):
+        """add channel folders to reconcile queue and start task"""
+        from home.tasks import reconcile_archive  # circular import
+
+        print(f"archive watcher: changed {sorted(changed)}")
+        RedisSet(self.CHANGED_KEY).add(list(changed))
+        reconcile_archive.delay()
@@ -253,4 +253,14 @@ class ScheduleBuilder:
             }
             schedule_dict.update(to_add)
 
+        from home.src.download.scan_schedule import (  # circular import
+            ChannelScanSchedule,
+        )
+
+        if ChannelScanSchedule.ENABLED:
+            schedule_dict["schedule_scan_due_channels"] = {
+                "task": "scan_due_channels",
+                "schedule": crontab(minute=f"*/{ChannelScanSchedule.TICK}"),
+            }
+
         return schedule_dict
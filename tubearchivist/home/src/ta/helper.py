@@ -4,14 +4,16 @@ Loose collection of helper functions
 """
 
 import json
+import os
 import re
 import string
+import struct
 import subprocess
 import unicodedata
+from functools import lru_cache
 from urllib.parse import parse_qs, urlparse
 
 import requests
-import yt_dlp
 
 
 def get_total_hits(index, es_url, es_auth, match_field):
@@ -28,13 +30,17 @@ def get_total_hits(index, es_url, es_auth, match_field):
     return total_hits
 
 
+CLEAN_WHITELIST = frozenset("-_.() " + string.ascii_letters + string.digits)
+CLEAN_SPACES = re.compile(r"[ ]{2,}")
+
+
+@lru_cache(maxsize=8192)
 def clean_string(file_name):
     """clean string to only asci characters"""
-    whitelist = "-_.() " + string.ascii_letters + string.digits
     normalized = unicodedata.normalize("NFKD", file_name)
     ascii_only = normalized.encode("ASCII", "ignore").decode().strip()
-    white_listed = "".join(c for c in ascii_only if c in whitelist)
-    cleaned = re.sub(r"[ ]{2,}", " ", white_listed)
+    white_listed = "".join(c for c in ascii_only if c in CLEAN_WHITELIST)
+    cleaned = CLEAN_SPACES.sub(" ", white_listed)
     return cleaned
 
 
@@ -137,6 +143,10 @@ class UrlListParser:
             "extract_flat": True,
             "playlistend": 0,
         }
+        import yt_dlp
+        from home.src.ta.ratelimit import RateLimiter  # circular import
+
+        RateLimiter("yt_extract").acquire()
         url_info = yt_dlp.YoutubeDL(obs).extract_info(url, download=False)
         try:
             channel_id = url_info["channel_id"]
@@ -149,32 +159,13 @@ class UrlListParser:
 
 class DurationConverter:
     """
-    using ffmpeg to get and parse duration from filepath
+    get and parse duration from filepath
     """
 
     @staticmethod
     def get_sec(file_path):
         """read duration from file"""
-        duration = subprocess.run(
-            [
-                "ffprobe",
-                "-v",
-                "error",
-                "-show_entries",
-                "format=duration",
-                "-of",
-                "default=noprint_wrappers=1:nokey=1",
-                file_path,
-            ],
-            capture_output=True,
-            check=True,
-        )
-        duration_raw = duration.stdout.decode().strip()
-        if duration_raw == "N/A":
-            return 0
-
-        duration_sec = int(float(duration_raw))
-        return duration_sec
+        return MediaProbe(file_path).get_info()["duration"]
 
     @staticmethod
     def get_str(duration_sec):
@@ -196,3 +187,196 @@ class DurationConverter:
             duration_str = duration_str + "00:"
         duration_str = duration_str + str(secs).zfill(2)
         return duration_str
+
+
+class MediaProbe:
+    """
+    read duration and stream info from media file
+    parse mp4 atoms natively, ffprobe as fallback for other files
+    """
+
+    CODECS = {
+        b"avc1": "h264",
+        b"avc3": "h264",
+        b"hvc1": "hevc",
+        b"hev1": "hevc",
+        b"vp09": "vp9",
+        b"av01": "av1",
+        b"mp4a": "aac",
+        b"Opus": "opus",
+        b".mp3": "mp3",
+        b"ac-3": "ac3",
+        b"ec-3": "eac3",
+        b"fLaC": "flac",
+    }
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file_size = os.path.getsize(file_path)
+
+    def get_info(self):
+        """get dict of duration in sec, bitrate, resolution and codecs"""
+        try:
+            media_info = self._parse_mp4()
+        except (OSError, ValueError, struct.error):
+            media_info = False
+
+        if not media_info:
+            print(f"{self.file_path}: fall back to ffprobe")
+            media_info = self._probe()
+
+        return media_info
+
+    def _parse_mp4(self):
+        """read movie and track headers from moov atom"""
+        with open(self.file_path, "rb") as media_file:
+            file_range = (0, self.file_size)
+            moov = self._find(media_file, file_range, b"moov")
+            if not moov:
+                return False
+
+            mvhd = self._read(media_file, (moov, b"mvhd"))
+            if not mvhd:
+                return False
+
+            if mvhd[0] == 1:
+                timescale, duration = struct.unpack(">IQ", mvhd[20:32])
+            else:
+                timescale, duration = struct.unpack(">II", mvhd[12:20])
+            if not timescale or duration in (0, 0xFFFFFFFF):
+                # fragmented or broken, let ffprobe figure it out
+                return False
+
+            duration_sec = duration / timescale
+            media_info = {
+                "duration": int(duration_sec),
+                "bitrate": int(self.file_size * 8 / duration_sec),
+                "width": 0,
+                "height": 0,
+                "video_codec": False,
+                "audio_codec": False,
+            }
+            for name, start, end in self._children(media_file, moov):
+                if name == b"trak":
+                    self._parse_trak(media_file, (start, end), media_info)
+
+        return media_info
+
+    def _parse_trak(self, media_file, trak, media_info):
+        """add codec and resolution of track to media_info"""
+        hdlr = self._read(media_file, (trak, b"mdia", b"hdlr"))
+        stsd = self._read(
+            media_file, (trak, b"mdia", b"minf", b"stbl", b"stsd")
+        )
+        if not hdlr or not stsd:
+            return
+
+        fourcc = stsd[12:16]
+        codec = self.CODECS.get(fourcc, fourcc.decode(errors="ignore"))
+        handler = hdlr[8:12]
+        if handler == b"vide" and not media_info["video_codec"]:
+            tkhd = self._read(media_file, (trak, b"tkhd"))
+            if not tkhd or len(tkhd) < 8:
+                raise ValueError("video track without track header")
+
+            # fixed point 16.16 at end of track header
+            width, height = struct.unpack(">II", tkhd[-8:])
+            media_info.update(
+                {
+                    "video_codec": codec,
+                    "width": width >> 16,
+                    "height": height >> 16,
+                }
+            )
+        elif handler == b"soun" and not media_info["audio_codec"]:
+            media_info["audio_codec"] = codec
+
+    def _read(self, media_file, atom_path, max_size=512):
+        """read start of payload at path (parent_range, name, ...)"""
+        atom_range = atom_path[0]
+        for name in atom_path[1:]:
+            atom_range = self._find(media_file, atom_range, name)
+            if not atom_range:
+                return False
+
+        start, end = atom_range
+        media_file.seek(start)
+        return media_file.read(min(end - start, max_size))
+
+    def _find(self, media_file, parent_range, name):
+        """get payload range of first child atom matching name"""
+        for child_name, start, end in self._children(media_file, parent_range):
+            if child_name == name:
+                return (start, end)
+
+        return False
+
+    @staticmethod
+    def _children(media_file, parent_range):
+        """yield name and payload range of atoms in parent range"""
+        offset, parent_end = parent_range
+        while offset + 8 <= parent_end:
+            media_file.seek(offset)
+            size, name = struct.unpack(">I4s", media_file.read(8))
+            header = 8
+            if size == 1:
+                size = struct.unpack(">Q", media_file.read(8))[0]
+                header = 16
+            elif size == 0:
+                size = parent_end - offset
+
+            if size < header:
+                raise ValueError(f"invalid atom size at {offset}")
+
+            yield name, offset + header, offset + size
+            offset = offset + size
+
+    def _probe(self):
+        """get info from ffprobe"""
+        probe = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration,bit_rate"
+                + ":stream=codec_type,codec_name,width,height",
+                "-of",
+                "json",
+                self.file_path,
+            ],
+            capture_output=True,
+            check=True,
+        )
+        probe_json = json.loads(probe.stdout.decode())
+        format_info = probe_json.get("format", {})
+        media_info = {
+            "duration": self._to_int(format_info.get("duration")),
+            "bitrate": self._to_int(format_info.get("bit_rate")),
+            "width": 0,
+            "height": 0,
+            "video_codec": False,
+            "audio_codec": False,
+        }
+        for stream in probe_json.get("streams", []):
+            codec_type = stream.get("codec_type")
+            if codec_type == "video" and not media_info["video_codec"]:
+                media_info.update(
+                    {
+                        "video_codec": stream.get("codec_name"),
+                        "width": self._to_int(stream.get("width")),
+                        "height": self._to_int(stream.get("height")),
+                    }
+                )
+            elif codec_type == "audio" and not media_info["audio_codec"]:
+                media_info["audio_codec"] = stream.get("codec_name")
+
+        return media_info
+
+    @staticmethod
+    def _to_int(value):
+        """parse number from ffprobe, 0 if not available"""
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
@@ -0,0 +1,73 @@
+"""
+functionality:
+- token bucket rate limiter shared by all workers through redis
+- separate buckets for the different youtube facing services
+"""
+
+from time import sleep
+
+from home.src.ta.config import AppConfig
+from home.src.ta.ta_redis import RedisArchivist
+
+
+class RateLimiter(RedisArchivist):
+    """acquire a token from a redis backed token bucket before calling out"""
+
+    # rate in tokens per second, burst is max tokens saved up while idle
+    BUCKETS = {
+        "yt_extract": {"rate": 1, "burst": 10},
+        "thumbnail": {"rate": 20, "burst": 40},
+        "channel_scrape": {"rate": 0.5, "burst": 5},
+        "ryd": {"rate": 5, "burst": 10},
+    }
+
+    # refill, then take a token or return ms to wait for the next one
+    LUA_TAKE = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local now_raw = redis.call("TIME")
+        local now = now_raw[1] * 1000 + math.floor(now_raw[2] / 1000)
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "stamp")
+        local tokens = tonumber(bucket[1]) or burst
+        local stamp = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + (now - stamp) / 1000 * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = math.ceil((1 - tokens) / rate * 1000)
+        end
+        redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "stamp", now)
+        redis.call("PEXPIRE", KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+        return wait
+    """
+
+    def __init__(self, bucket):
+        super().__init__()
+        self.bucket = bucket
+        self.key = f"{self.NAME_SPACE}ratelimit:{bucket}"
+        self.rate, self.burst = self._get_rate()
+        self.take = self.redis_connection.register_script(self.LUA_TAKE)
+
+    def _get_rate(self):
+        """get rate and burst, extraction follows user sleep_interval"""
+        rate = self.BUCKETS[self.bucket]["rate"]
+        burst = self.BUCKETS[self.bucket]["burst"]
+        if self.bucket == "yt_extract":
+            sleep_interval = AppConfig().config["downloads"]["sleep_interval"]
+            rate = 1 / sleep_interval if sleep_interval else False
+
+        return rate, burst
+
+    def acquire(self):
+        """block until a token is available"""
+        if not self.rate:
+            # deactivated
+            return
+
+        while True:
+            wait_ms = self.take(keys=[self.key], args=[self.rate, self.burst])
+            if not wait_ms:
+                return
+
+            sleep(wait_ms / 1000)
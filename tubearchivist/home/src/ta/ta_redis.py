@@ -1,7 +1,9 @@
 """
 functionality:
 - interact with redis
+- publish progress messages for live frontend updates
 - hold temporary download queue in redis
+- track sets of ids for incremental processing
 """
 
 import json
@@ -47,6 +49,9 @@ class RedisArchivist:
                 "EXPIRE", self.NAME_SPACE + key, secs
             )
 
+        if key.startswith("message:"):
+            self.publish_progress(key)
+
     def get_message(self, key):
         """get message dict from redis"""
         reply = self.redis_connection.execute_command(
@@ -77,24 +82,31 @@ class RedisArchivist:
         response = self.redis_connection.execute_command(
             "DEL", self.NAME_SPACE + key
         )
+        if key.startswith("message:"):
+            self.publish_progress(key)
+
         return response
 
-    def get_lock(self, lock_key):
+    def publish_progress(self, key):
+        """notify subscribed progress streams about changed message"""
+        self.redis_connection.execute_command(
+            "PUBLISH", self.NAME_SPACE + "progress", key
+        )
+
+    def get_lock(self, lock_key, timeout=None):
         """handle lock for task management"""
-        redis_lock = self.redis_connection.lock(self.NAME_SPACE + lock_key)
+        redis_lock = self.redis_connection.lock(
+            self.NAME_SPACE + lock_key, timeout=timeout
+        )
         return redis_lock
 
     def get_progress(self):
         """get a list of all progress messages"""
-        all_messages = []
-        for channel in self.CHANNELS:
-            key = "message:" + channel
-            reply = self.redis_connection.execute_command(
-                "JSON.GET", self.NAME_SPACE + key
-            )
-            if reply:
-                json_str = json.loads(reply)
-                all_messages.append(json_str)
+        all_keys = [f"{self.NAME_SPACE}message:{i}" for i in self.CHANNELS]
+        reply = self.redis_connection.execute_command(
+            "JSON.MGET", *all_keys, "."
+        )
+        all_messages = [json.loads(i) for i in reply if i]
 
         return all_messages
 
@@ -169,3 +181,48 @@ class RedisQueue:
     def trim(self, size):
         """trim the queue based on settings amount"""
         self.conn.execute_command("LTRIM", self.key, 0, size)
+
+
+class RedisSet:
+    """track unique items in a redis set"""
+
+    REDIS_HOST = os.environ.get("REDIS_HOST")
+    REDIS_PORT = os.environ.get("REDIS_PORT") or 6379
+    NAME_SPACE = "ta:"
+
+    def __init__(self, key):
+        self.key = self.NAME_SPACE + key
+        self.conn = redis.Redis(host=self.REDIS_HOST, port=self.REDIS_PORT)
+
+    def add(self, to_add):
+        """add list of items to set, return count of new items"""
+        if not to_add:
+            return 0
+
+        return self.conn.execute_command("SADD", self.key, *to_add)
+
+    def remove(self, to_remove):
+        """remove list of items from set"""
+        if to_remove:
+            self.conn.execute_command("SREM", self.key, *to_remove)
+
+    def is_member(self, item):
+        """check if item is in set"""
+        return bool(self.conn.execute_command("SISMEMBER", self.key, item))
+
+    def get_all(self):
+        """return all items in set"""
+        result = self.conn.execute_command("SMEMBERS", self.key)
+        return {i.decode() for i in result}
+
+    def pop_all(self):
+        """atomically return all items and clear set"""
+        pipeline = self.conn.pipeline()
+        pipeline.execute_command("SMEMBERS", self.key)
+        pipeline.execute_command("DEL", self.key)
+        result, _ = pipeline.execute()
+        return {i.decode() for i in result}
+
+    def clear(self):
+        """delete set from redis"""
+        self.conn.execute_command("DEL", self.key)
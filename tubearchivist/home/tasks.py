@@ -7,10 +7,13 @@ Functionality:
 """
 
 import os
+from uuid import uuid4
 
 import home.apps as startup_apps
-from celery import Celery, shared_task
-from home.src.download.queue import PendingList
+from celery import Celery, chord, shared_task
+from home.src.download.known_ids import KnownIds
+from home.src.download.queue import AddProgress, PendingList
+from home.src.download.scan_schedule import ChannelScanSchedule
 from home.src.download.subscriptions import (
     ChannelSubscription,
     PlaylistSubscription,
@@ -21,28 +24,44 @@ from home.src.es.index_setup import backup_all_indexes, restore_from_backup
 from home.src.index.channel import YoutubeChannel
 from home.src.index.filesystem import (
     ManualImport,
+    enrich_imported,
+    reconcile_folders,
     reindex_old_documents,
     scan_filesystem,
 )
 from home.src.index.playlist import YoutubePlaylist
+from home.src.index.watcher import ArchiveWatcher
 from home.src.ta.config import AppConfig, ScheduleBuilder
 from home.src.ta.helper import UrlListParser
-from home.src.ta.ta_redis import RedisArchivist, RedisQueue
+from home.src.ta.ta_redis import RedisArchivist, RedisQueue, RedisSet
 
 CONFIG = AppConfig().config
 REDIS_HOST = os.environ.get("REDIS_HOST")
 REDIS_PORT = os.environ.get("REDIS_PORT") or 6379
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
-app = Celery("tasks", broker=f"redis://{REDIS_HOST}:{REDIS_PORT}")
+app = Celery(
+    "tasks",
+    broker=f"redis://{REDIS_HOST}:{REDIS_PORT}",
+    backend=f"redis://{REDIS_HOST}:{REDIS_PORT}",
+)
 app.config_from_object("django.conf:settings", namespace="ta:")
 app.autodiscover_tasks()
 app.conf.timezone = os.environ.get("TZ") or "UTC"
-
-
-@shared_task(name="update_subscribed")
-def update_subscribed():
-    """look for missing videos and add to pending"""
+# tasks are routed by workload class with queue option in shared_task
+app.conf.task_default_queue = "interactive"
+app.conf.worker_prefetch_multiplier = 1
+# results only needed to join chords, enabled per task
+app.conf.task_ignore_result = True
+# videos per chunk when adding to the download queue
+ADD_CHUNK_SIZE = 50
+
+
+@shared_task(name="update_subscribed", queue="metadata")
+def update_subscribed(force=False):
+    """look for missing videos and add to pending
+    force to scan all channels, also with adaptive scan enabled
+    """
     message = {
         "status": "message:rescan",
         "level": "info",
@@ -58,7 +77,11 @@ def update_subscribed():
         have_lock = my_lock.acquire(blocking=False)
         if have_lock:
             channel_handler = ChannelSubscription()
-            missing_from_channels = channel_handler.find_missing()
+            if ChannelScanSchedule.ENABLED and not force:
+                # channels get scanned individually by scan_due_channels
+                missing_from_channels = []
+            else:
+                missing_from_channels = channel_handler.find_missing()
             playlist_handler = PlaylistSubscription()
             missing_from_playlists = playlist_handler.find_missing()
             missing = missing_from_channels + missing_from_playlists
@@ -66,6 +89,11 @@ def update_subscribed():
                 pending_handler = PendingList()
                 all_videos_added = pending_handler.add_to_pending(missing)
                 ThumbManager().download_vid(all_videos_added)
+            # only after adding, failed runs scan from previous mark again
+            channel_handler.set_last_seen()
+            if ChannelScanSchedule.ENABLED and force:
+                ChannelScanSchedule().reschedule(channel_handler.scan_counts)
+            ThumbManager().download_queued_playlists()
         else:
             print("Did not acquire rescan lock.")
 
@@ -74,7 +102,25 @@ def update_subscribed():
             my_lock.release()
 
 
-@shared_task(name="download_pending")
+@shared_task(name="scan_due_channels", queue="metadata")
+def scan_due_channels():
+    """scan subscribed channels due by their upload cadence"""
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("rescan")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            ChannelScanSchedule().run()
+        else:
+            print("Did not acquire rescan lock.")
+
+    finally:
+        if have_lock:
+            my_lock.release()
+
+
+@shared_task(name="download_pending", queue="download")
 def download_pending():
     """download latest pending videos"""
     have_lock = False
@@ -95,7 +141,7 @@ def download_pending():
             my_lock.release()
 
 
-@shared_task
+@shared_task(queue="interactive")
 def download_single(youtube_id):
     """start download single video now"""
     queue = RedisQueue("dl_queue")
@@ -125,31 +171,69 @@ def download_single(youtube_id):
             my_lock.release()
 
 
-@shared_task
+@shared_task(queue="metadata")
 def extrac_dl(youtube_ids):
-    """parse list passed and add to pending"""
+    """parse list passed, add to pending in parallel chunks"""
     pending_handler = PendingList()
     missing_videos = pending_handler.parse_url_list(youtube_ids)
-    all_videos_added = pending_handler.add_to_pending(missing_videos)
+    unique_ids = list(dict.fromkeys(missing_videos))
+    missing_videos = KnownIds().filter_unknown(unique_ids)
     missing_playlists = pending_handler.missing_from_playlists
 
+    batch_id = uuid4().hex
+    AddProgress(batch_id).start(len(missing_videos))
+    all_chunks = []
+    for idx in range(0, len(missing_videos), ADD_CHUNK_SIZE):
+        end = idx + ADD_CHUNK_SIZE
+        all_chunks.append(
+            add_pending_chunk.s(missing_videos[idx:end], batch_id)
+        )
+
+    callback = add_pending_done.s(missing_playlists, batch_id)
+    if all_chunks:
+        chord(all_chunks)(callback)
+    else:
+        callback.delay([])
+
+
+@shared_task(queue="metadata", acks_late=True, ignore_result=False)
+def add_pending_chunk(missing_videos, batch_id):
+    """add chunk of batch to pending, return videos added"""
+    pending_handler = PendingList()
+    pending_handler.progress = AddProgress(batch_id)
+    try:
+        all_videos_added = pending_handler.add_to_pending(missing_videos)
+    except Exception as err:  # pylint: disable=broad-except
+        # don't fail the other chunks
+        print(f"{batch_id}: failed to add chunk to queue: {err}")
+        return []
+
+    return all_videos_added
+
+
+@shared_task(queue="metadata")
+def add_pending_done(all_chunks, missing_playlists, batch_id):
+    """all chunks added, index playlists and download thumbnails"""
+    AddProgress(batch_id).clear()
+    all_videos_added = [video for chunk in all_chunks for video in chunk]
+
     thumb_handler = ThumbManager()
     if missing_playlists:
-        new_thumbs = PlaylistSubscription().process_url_str(
+        PlaylistSubscription().process_url_str(
             missing_playlists, subscribed=False
         )
-        thumb_handler.download_playlist(new_thumbs)
 
+    thumb_handler.download_queued_playlists()
     thumb_handler.download_vid(all_videos_added)
 
 
-@shared_task(name="check_reindex")
+@shared_task(name="check_reindex", queue="metadata")
 def check_reindex():
     """run the reindex main command"""
     reindex_old_documents()
 
 
-@shared_task
+@shared_task(queue="metadata")
 def run_manual_import():
     """called from settings page, to go through import folder"""
     print("starting media file import")
@@ -163,6 +247,7 @@ def run_manual_import():
             if import_handler.identified:
                 all_videos_added = import_handler.process_import()
                 ThumbManager().download_vid(all_videos_added)
+                enrich_manual_import.delay()
         else:
             print("Did not acquire lock form import.")
 
@@ -171,14 +256,31 @@ def run_manual_import():
             my_lock.release()
 
 
-@shared_task(name="run_backup")
+@shared_task(queue="metadata")
+def enrich_manual_import():
+    """refresh videos and channels imported from local metadata"""
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("import_enrich")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            enrich_imported()
+        else:
+            print("Did not acquire lock for import enrich.")
+    finally:
+        if have_lock:
+            my_lock.release()
+
+
+@shared_task(name="run_backup", queue="maintenance")
 def run_backup(reason="auto"):
     """called from settings page, dump backup to zip file"""
     backup_all_indexes(reason)
     print("backup finished")
 
 
-@shared_task
+@shared_task(queue="maintenance")
 def run_restore_backup(filename):
     """called from settings page, dump backup to zip file"""
     restore_from_backup(filename)
@@ -209,28 +311,145 @@ def kill_dl(task_id):
     RedisArchivist().set_message("message:download", mess_dict)
 
 
-@shared_task
+@shared_task(queue="maintenance")
 def rescan_filesystem():
     """check the media folder for mismatches"""
     scan_filesystem()
     validate_thumbnails()
 
 
-@shared_task(name="thumbnail_check")
+@shared_task(queue="maintenance")
+def reconcile_archive():
+    """update index for channel folders changed in archive"""
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("archive_reconcile")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            changed_set = RedisSet(ArchiveWatcher.CHANGED_KEY)
+            while True:
+                channel_folders = changed_set.pop_all()
+                if not channel_folders:
+                    break
+                reconcile_folders(sorted(channel_folders))
+        else:
+            print("Did not acquire lock for archive reconcile.")
+    finally:
+        if have_lock:
+            my_lock.release()
+
+
+@shared_task(name="thumbnail_check", queue="thumbnails")
 def thumbnail_check():
-    """validate thumbnails"""
-    validate_thumbnails()
+    """validate thumbnails changed since last run"""
+    validate_thumbnails(incremental=True)
 
 
-@shared_task
+@shared_task(queue="thumbnails")
 def re_sync_thumbs():
     """sync thumbnails to mediafiles"""
-    handler = ThumbManager()
-    video_list = handler.get_thumb_list()
-    handler.write_all_thumbs(video_list)
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("thumb_embed")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            handler = ThumbManager()
+            video_list = handler.get_thumb_list()
+            handler.write_all_thumbs(video_list)
+        else:
+            print("Did not acquire lock for thumbnail embed.")
+    finally:
+        if have_lock:
+            my_lock.release()
+
+
+@shared_task(queue="thumbnails")
+def backfill_thumb_variants():
+    """build resized variants and lqip for existing thumbnails"""
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("thumb_variants")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            ThumbManager().backfill_variants()
+        else:
+            print("Did not acquire lock for thumbnail backfill.")
+    finally:
+        if have_lock:
+            my_lock.release()
+
+
+@shared_task(queue="thumbnails")
+def migrate_thumb_layout():
+    """move cached video thumbnails into configured layout"""
+    target_layout = AppConfig().config["application"]["thumb_layout"]
+    ThumbManager().migrate_layout(target_layout)
+
+
+@shared_task(name="download_channel_art", queue="thumbnails")
+def download_channel_art():
+    """download queued channel artwork in batches"""
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("channel_art")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            ThumbManager().download_queued_channels()
+        else:
+            print("Did not acquire lock for channel art.")
+    finally:
+        if have_lock:
+            my_lock.release()
+            # queued after last drain while task without lock gave up
+            if ThumbManager.is_queued(ThumbManager.CHANNEL_QUEUE):
+                download_channel_art.delay()
+
+
+@shared_task(name="download_playlist_art", queue="thumbnails")
+def download_playlist_art():
+    """download queued playlist artwork"""
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("playlist_art")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            ThumbManager().download_queued_playlists()
+        else:
+            print("Did not acquire lock for playlist art.")
+    finally:
+        if have_lock:
+            my_lock.release()
+            # queued after last drain while task without lock gave up
+            if ThumbManager.is_queued(ThumbManager.PLAYLIST_QUEUE):
+                download_playlist_art.delay()
+
+
+@shared_task(queue="interactive")
+def fetch_missing_thumbs():
+    """download thumbnails requested by frontend but missing in cache"""
+    have_lock = False
+    my_lock = RedisArchivist().get_lock("thumb_missing")
+
+    try:
+        have_lock = my_lock.acquire(blocking=False)
+        if have_lock:
+            ThumbManager().download_requested()
+        else:
+            print("Did not acquire lock for missing thumbnails.")
+    finally:
+        if have_lock:
+            my_lock.release()
+            # requested after last drain while task without lock gave up
+            if ThumbManager.is_queued(ThumbManager.MISSING_KEY):
+                fetch_missing_thumbs.delay()
 
 
-@shared_task
+@shared_task(queue="interactive")
 def subscribe_to(url_str):
     """take a list of urls to subscribe to"""
     to_subscribe_list = UrlListParser(url_str).process_list()
@@ -238,9 +457,8 @@ def subscribe_to(url_str):
     for item in to_subscribe_list:
         to_sub_id = item["url"]
         if item["type"] == "playlist":
-            new_thumbs = PlaylistSubscription().process_url_str([item])
-            if new_thumbs:
-                ThumbManager().download_playlist(new_thumbs)
+            PlaylistSubscription().process_url_str([item])
+            ThumbManager().download_queued_playlists()
             continue
 
         if item["type"] == "video":
@@ -265,7 +483,7 @@ def subscribe_to(url_str):
         counter = counter + 1
 
 
-@shared_task
+@shared_task(queue="metadata")
 def index_channel_playlists(channel_id):
     """add all playlists of channel to index"""
     channel = YoutubeChannel(channel_id)
@@ -312,13 +530,14 @@ def index_channel_playlists(channel_id):
             if i["downloaded"]
         ]
         if not downloaded:
+            # art queued by build_json, not needed
+            ThumbManager().dequeue_playlist(playlist_id)
             continue
 
         playlist.upload_to_es()
         playlist.add_vids_to_playlist()
 
-    if all_playlists:
-        playlist.get_playlist_art()
+    ThumbManager().download_queued_playlists()
 
     return
 
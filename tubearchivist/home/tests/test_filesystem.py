@@ -0,0 +1,79 @@
+"""benchmark filesystem scanner on synthetic archive"""
+
+import os
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from home.src.index.filesystem import FilesystemScanner
+
+
+class FilesystemScannerTests(SimpleTestCase):
+    """comparison should be correct and scale linear with archive size"""
+
+    CHANNELS = 100
+    SMALL = 10000
+    LARGE = 100000
+
+    def _build_archive(self, total):
+        """build downloaded and matching indexed tuples
+        every 7th file is unindexed, every 10th has a changed title
+        and there is an indexed video without media file for every 100
+        """
+        all_downloaded = []
+        all_indexed = []
+        for idx in range(total):
+            channel_name = f"channel{idx % self.CHANNELS}"
+            youtube_id = f"{idx:011d}"
+            filename = f"20220101_{youtube_id}_video {idx}.mp4"
+            all_downloaded.append((channel_name, filename, youtube_id))
+            if idx % 7 == 0:
+                continue
+
+            title = f"renamed {idx}" if idx % 10 == 0 else f"video {idx}"
+            media_url = os.path.join(channel_name, filename)
+            all_indexed.append((youtube_id, media_url, "2022-01-01", title))
+
+        for idx in range(total // 100):
+            youtube_id = f"missing{idx:04d}"
+            media_url = f"channel0/20220101_{youtube_id}_missing.mp4"
+            all_indexed.append((youtube_id, media_url, "2022-01-01", "gone"))
+
+        return all_downloaded, all_indexed
+
+    def _run_scan(self, total):
+        """compare synthetic archive, return scanner and time"""
+        all_downloaded, all_indexed = self._build_archive(total)
+        with mock.patch.object(
+            FilesystemScanner,
+            "get_all_downloaded",
+            return_value=all_downloaded,
+        ), mock.patch.object(
+            FilesystemScanner, "get_all_indexed", return_value=all_indexed
+        ):
+            start = time.perf_counter()
+            scanner = FilesystemScanner()
+            scanner.list_comarison()
+            elapsed = time.perf_counter() - start
+
+        return scanner, elapsed
+
+    def test_scan_result(self):
+        """find unindexed, missing and renamed videos"""
+        scanner, _ = self._run_scan(self.SMALL)
+        expected_index = len(range(0, self.SMALL, 7))
+        expected_rename = len(
+            [i for i in range(0, self.SMALL, 10) if i % 7 != 0]
+        )
+        self.assertEqual(len(scanner.to_index), expected_index)
+        self.assertEqual(len(scanner.to_delete), self.SMALL // 100)
+        self.assertEqual(len(scanner.to_rename), expected_rename)
+        self.assertEqual(len(scanner.mismatch), expected_rename)
+
+    def test_linear_scaling(self):
+        """ten times the files should take about ten times as long"""
+        _, small_time = self._run_scan(self.SMALL)
+        scanner, large_time = self._run_scan(self.LARGE)
+        self.assertEqual(len(scanner.all_downloaded), self.LARGE)
+        # quadratic comparison would be around 100 times slower
+        self.assertLess(large_time / small_time, 30)
@@ -0,0 +1,77 @@
+"""test native mp4 parsing"""
+
+import os
+import struct
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+from home.src.ta.helper import MediaProbe
+
+
+def build_atom(name, payload):
+    """build mp4 atom with 32 bit size header"""
+    return struct.pack(">I4s", 8 + len(payload), name) + payload
+
+
+def build_trak(handler, fourcc, width=0, height=0, header=True):
+    """build minimal track with header, handler and sample description"""
+    tkhd = b""
+    if header:
+        size = struct.pack(">II", width << 16, height << 16)
+        tkhd = build_atom(b"tkhd", bytes(76) + size)
+    hdlr = build_atom(b"hdlr", bytes(8) + handler + bytes(12))
+    sample_entry = struct.pack(">I4s", 16, fourcc) + bytes(8)
+    stsd = build_atom(b"stsd", bytes(4) + struct.pack(">I", 1) + sample_entry)
+    minf = build_atom(b"minf", build_atom(b"stbl", stsd))
+    mdia = build_atom(b"mdia", hdlr + minf)
+    return build_atom(b"trak", tkhd + mdia)
+
+
+class MediaProbeTests(SimpleTestCase):
+    """read duration and streams without ffprobe"""
+
+    def _write_mp4(self, moov_first=False, header=True):
+        """write minimal mp4 with 125.5 sec, h264 1080p and aac"""
+        mvhd = build_atom(
+            b"mvhd", bytes(12) + struct.pack(">II", 1000, 125500) + bytes(80)
+        )
+        moov = build_atom(
+            b"moov",
+            mvhd
+            + build_trak(b"vide", b"avc1", 1920, 1080, header=header)
+            + build_trak(b"soun", b"mp4a"),
+        )
+        ftyp = build_atom(b"ftyp", b"isom" + bytes(4))
+        mdat = build_atom(b"mdat", bytes(10000))
+        if moov_first:
+            data = ftyp + moov + mdat
+        else:
+            data = ftyp + mdat + moov
+
+        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
+            f.write(data)
+
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_parse_mp4(self):
+        """moov at end of file like written by ffmpeg"""
+        media_info = MediaProbe(self._write_mp4()).get_info()
+        self.assertEqual(media_info["duration"], 125)
+        self.assertEqual(media_info["video_codec"], "h264")
+        self.assertEqual(media_info["audio_codec"], "aac")
+        self.assertEqual(media_info["width"], 1920)
+        self.assertEqual(media_info["height"], 1080)
+        self.assertTrue(media_info["bitrate"])
+
+    def test_parse_faststart(self):
+        """moov in front of mdat"""
+        media_info = MediaProbe(self._write_mp4(moov_first=True)).get_info()
+        self.assertEqual(media_info["duration"], 125)
+
+    def test_missing_track_header(self):
+        """video track without tkhd falls back to ffprobe"""
+        probe = MediaProbe(self._write_mp4(header=False))
+        with mock.patch.object(probe, "_probe", return_value="probed"):
+            self.assertEqual(probe.get_info(), "probed")
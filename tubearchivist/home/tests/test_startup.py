@@ -0,0 +1,70 @@
+"""test import graph and footprint of a web worker"""
+
+import os
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+
+
+class WebStartupTests(SimpleTestCase):
+    """web workers should not load the download stack"""
+
+    HEAVY_MODULES = ["yt_dlp", "PIL", "bs4", "mutagen"]
+    MAX_RSS_MB = 120
+    MAX_IMPORT_MS = 3000
+    STARTUP_SCRIPT = (
+        "import resource, django;"
+        + "django.setup();"
+        + "import config.urls, home.views, api.views;"
+        + "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+
+    def _run_importtime(self):
+        """start a fresh interpreter like a uwsgi worker would"""
+        app_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        env = os.environ.copy()
+        env["DJANGO_SETTINGS_MODULE"] = "config.settings"
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", self.STARTUP_SCRIPT],
+            cwd=app_root,
+            env=env,
+            capture_output=True,
+            check=True,
+        )
+        return result.stdout.decode(), result.stderr.decode()
+
+    @staticmethod
+    def _parse_importtime(stderr):
+        """return imported modules and total import time in us"""
+        imported = {}
+        top_level = 0
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+
+            _, cumulative, module = line.split("|")
+            if not cumulative.strip().isdigit():
+                # header line
+                continue
+
+            imported[module.strip()] = int(cumulative)
+            if not module[1:].startswith(" "):
+                # not nested inside other import
+                top_level += int(cumulative)
+
+        return imported, top_level
+
+    def test_web_startup(self):
+        """heavy modules stay out, rss and import time stay low"""
+        stdout, stderr = self._run_importtime()
+        imported, import_us = self._parse_importtime(stderr)
+        for module in self.HEAVY_MODULES:
+            self.assertNotIn(module, imported, f"{module} loaded in web")
+
+        import_ms = import_us // 1000
+        rss_mb = int(stdout.strip().splitlines()[-1]) // 1024
+        self.assertLess(
+            import_ms, self.MAX_IMPORT_MS, f"imports took {import_ms}ms"
+        )
+        self.assertLess(rss_mb, self.MAX_RSS_MB, f"import time {import_ms}ms")
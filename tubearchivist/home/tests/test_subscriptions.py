@@ -0,0 +1,241 @@
+"""test concurrent subscription scan"""
+
+import json
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from home.src.download import scan_schedule, subscriptions
+
+
+class ScanConcurrentTests(SimpleTestCase):
+    """scan in parallel, keep order, isolate failures"""
+
+    def setUp(self):
+        patcher = mock.patch.object(subscriptions, "RedisArchivist")
+        self.redis = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _scan_item(item):
+        """slow network call, fails for every fifth item"""
+        time.sleep(0.05)
+        if item % 5 == 0:
+            raise ConnectionError("blocked")
+
+        return [item]
+
+    def test_results_in_order(self):
+        """failed items return False, others keep their position"""
+        all_items = list(range(1, 21))
+        results = subscriptions.scan_concurrent(
+            all_items, self._scan_item, "scan"
+        )
+        expected = [False if i % 5 == 0 else [i] for i in all_items]
+        self.assertEqual(results, expected)
+
+    def test_progress_aggregated(self):
+        """one notification per item, last one expires fast"""
+        subscriptions.scan_concurrent(list(range(1, 9)), self._scan_item, "x")
+        set_message = self.redis.return_value.set_message
+        self.assertEqual(set_message.call_count, 8)
+        last_call = set_message.call_args
+        self.assertEqual(
+            last_call.kwargs["message"]["message"], "Progress: 8/8"
+        )
+        self.assertEqual(last_call.kwargs["expire"], 4)
+
+    def test_scales_with_workers(self):
+        """wall time drops with concurrency"""
+        all_items = list(range(1, 17))
+        with mock.patch.object(subscriptions, "SCAN_WORKERS", 1):
+            start = time.perf_counter()
+            subscriptions.scan_concurrent(all_items, self._scan_item, "x")
+            serial_time = time.perf_counter() - start
+
+        with mock.patch.object(subscriptions, "SCAN_WORKERS", 8):
+            start = time.perf_counter()
+            subscriptions.scan_concurrent(all_items, self._scan_item, "x")
+            parallel_time = time.perf_counter() - start
+
+        self.assertLess(parallel_time * 3, serial_time)
+
+    def test_empty(self):
+        """nothing subscribed"""
+        results = subscriptions.scan_concurrent([], self._scan_item, "x")
+        self.assertEqual(results, [])
+
+
+class IncrementalScanTests(SimpleTestCase):
+    """stop at high-water mark, widen only if all videos are new"""
+
+    CHANNEL_SIZE = 50
+
+    def setUp(self):
+        config = {"subscriptions": {"channel_size": self.CHANNEL_SIZE}}
+        config["application"] = {"es_url": False, "es_auth": False}
+        patcher = mock.patch.object(subscriptions, "AppConfig")
+        patcher.start().return_value.config = config
+        self.addCleanup(patcher.stop)
+        self.channel_videos = [
+            (f"video{i:06d}", f"title {i}") for i in range(80)
+        ]
+        self.requested = []
+
+    def _fake_extract(self, channel_id, limit=True):
+        """newest first, like the channel video tab"""
+        self.requested.append(limit)
+        return self.channel_videos[:limit]
+
+    def _scan(self, last_seen):
+        """scan single channel with last_seen mark"""
+        handler = subscriptions.ChannelSubscription()
+        handler.last_seen = {"channel": last_seen}
+        with mock.patch.object(
+            handler, "get_last_youtube_videos", side_effect=self._fake_extract
+        ):
+            new_videos = handler.get_new_videos("channel")
+
+        return handler, new_videos
+
+    @staticmethod
+    def _set_last_seen(handler, skipped=()):
+        """store marks, skipped ids were not added to pending"""
+        with mock.patch.object(
+            subscriptions, "KnownIds"
+        ) as known_ids, mock.patch.object(
+            subscriptions, "RedisArchivist"
+        ) as redis:
+            redis.NAME_SPACE = "ta:"
+            known_ids.return_value.filter_unknown.side_effect = lambda ids: [
+                i for i in ids if i in skipped
+            ]
+            handler.set_last_seen()
+
+        execute = redis.return_value.redis_connection.execute_command
+        if not execute.called:
+            return {}
+
+        marks = execute.call_args.args[2:]
+        return {i: json.loads(j) for i, j in zip(marks[::2], marks[1::2])}
+
+    def test_first_scan(self):
+        """no mark yet, scan full channel_size"""
+        handler, new_videos = self._scan([])
+        self.assertEqual(self.requested, [self.CHANNEL_SIZE])
+        self.assertEqual(len(new_videos), self.CHANNEL_SIZE)
+        expected_mark = [i[0] for i in self.channel_videos[:5]]
+        marks = self._set_last_seen(handler)
+        self.assertEqual(marks["channel"], expected_mark)
+
+    def test_nothing_new(self):
+        """single small request, mark unchanged"""
+        last_seen = [i[0] for i in self.channel_videos[:5]]
+        handler, new_videos = self._scan(last_seen)
+        self.assertEqual(self.requested, [handler.FIRST_PAGE])
+        self.assertEqual(new_videos, [])
+        self.assertNotIn("channel", self._set_last_seen(handler))
+
+    def test_skipped_stays_new(self):
+        """mark stops before video not added, like an upcoming premiere"""
+        last_seen = [i[0] for i in self.channel_videos[12:17]]
+        handler, _ = self._scan(last_seen)
+        skipped = [self.channel_videos[3][0]]
+        marks = self._set_last_seen(handler, skipped=skipped)
+        expected_mark = [i[0] for i in self.channel_videos[4:9]]
+        self.assertEqual(marks["channel"], expected_mark)
+
+    def test_few_new(self):
+        """new videos on first page before the mark"""
+        last_seen = [i[0] for i in self.channel_videos[2:7]]
+        handler, new_videos = self._scan(last_seen)
+        self.assertEqual(self.requested, [handler.FIRST_PAGE])
+        self.assertEqual(new_videos, self.channel_videos[:2])
+
+    def test_widen(self):
+        """all new on first page, widen to channel_size"""
+        last_seen = [i[0] for i in self.channel_videos[12:17]]
+        _, new_videos = self._scan(last_seen)
+        self.assertEqual(self.requested, [5, self.CHANNEL_SIZE])
+        self.assertEqual(new_videos, self.channel_videos[:12])
+
+    def test_deleted_mark(self):
+        """newest marked video deleted, stop at next one"""
+        last_seen = ["deleted0000"] + [i[0] for i in self.channel_videos[:4]]
+        _, new_videos = self._scan(last_seen)
+        self.assertEqual(new_videos, [])
+
+    def test_mark_not_found(self):
+        """stop widening at channel_size"""
+        _, new_videos = self._scan(["unknown0000"])
+        self.assertEqual(self.requested, [5, self.CHANNEL_SIZE])
+        self.assertEqual(len(new_videos), self.CHANNEL_SIZE)
+
+
+class ScanScheduleTests(SimpleTestCase):
+    """check active channels often, back off for dormant ones"""
+
+    DAY = 24 * 60 * 60
+
+    def setUp(self):
+        patcher = mock.patch.object(scan_schedule, "RedisArchivist")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.schedule = scan_schedule.ChannelScanSchedule()
+        self.schedule.JITTER = 0
+
+    def _observe(self, all_counts, every):
+        """run checks every seconds with new video counts, return state"""
+        state = {}
+        now = 1000000
+        for new_count in all_counts:
+            state = self.schedule.update_state(state, new_count, now)
+            now += every
+
+        return state
+
+    def test_first_check(self):
+        """no observation yet, use default interval"""
+        state = self._observe([50], self.DAY)
+        self.assertEqual(state["interval"], self.schedule.DEFAULT_INTERVAL)
+        self.assertEqual(self.schedule.get_delay(state), self.DAY / 2)
+
+    def test_active_channel(self):
+        """daily uploads, checked more than once a day"""
+        state = self._observe([5] + [2] * 20, self.DAY)
+        self.assertAlmostEqual(state["interval"], self.DAY / 2, delta=60)
+        self.assertLess(self.schedule.get_delay(state), self.DAY)
+
+    def test_dormant_channel(self):
+        """no uploads, delay doubles up to max delay"""
+        delays = []
+        state = {}
+        now = 1000000
+        for _ in range(8):
+            state = self.schedule.update_state(state, 0, now)
+            delay = self.schedule.get_delay(state)
+            delays.append(delay)
+            now += delay
+
+        self.assertGreaterEqual(delays[2], delays[1] * 2)
+        self.assertEqual(delays[-1], self.schedule.MAX_DELAY)
+
+    def test_min_delay(self):
+        """very active channel still not checked more than hourly"""
+        state = self._observe([5] + [50] * 10, self.DAY)
+        self.assertEqual(
+            self.schedule.get_delay(state), self.schedule.MIN_DELAY
+        )
+
+    def test_jitter_clamped(self):
+        """jitter never leaves min and max delay"""
+        self.schedule.JITTER = 0.1
+        dormant = {"interval": self.DAY, "misses": 16, "checked": 0}
+        active = {"interval": 60, "misses": 0, "checked": 0}
+        for _ in range(50):
+            self.assertLessEqual(
+                self.schedule.get_delay(dormant), self.schedule.MAX_DELAY
+            )
+            self.assertGreaterEqual(
+                self.schedule.get_delay(active), self.schedule.MIN_DELAY
+            )
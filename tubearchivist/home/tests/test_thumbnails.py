@@ -0,0 +1,51 @@
+"""test writing of hardlinked artwork"""
+
+import os
+import tempfile
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from home.src.download.thumbnails import ThumbManager
+from PIL import Image
+
+
+def build_img(color):
+    """encode single color jpg"""
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class LinkedArtTests(SimpleTestCase):
+    """rewriting art of one channel doesn't change linked channels"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.handler = ThumbManager.__new__(ThumbManager)
+
+    def _write(self, path, color):
+        """write channel icon of color to path"""
+        job = {"thumb_type": "icon", "path": path}
+        self.handler._write_img(job, build_img(color))
+
+    def test_rewrite_linked(self):
+        """linked channel keeps its art after other channel got new art"""
+        first = os.path.join(self.temp_dir.name, "first_thumb.jpg")
+        second = os.path.join(self.temp_dir.name, "second_thumb.jpg")
+        self._write(first, "red")
+        ThumbManager._link_art(first, second)
+        with open(second, "rb") as img_file:
+            expected = img_file.read()
+
+        self._write(first, "blue")
+
+        with open(second, "rb") as img_file:
+            self.assertEqual(img_file.read(), expected)
+        with open(first, "rb") as img_file:
+            self.assertNotEqual(img_file.read(), expected)
+        # no temp files left behind
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir.name)),
+            ["first_thumb.jpg", "second_thumb.jpg"],
+        )
@@ -18,6 +18,7 @@ from home.views import (
     VideoView,
     process,
     progress,
+    thumb_miss,
 )
 
 urlpatterns = [
@@ -54,4 +55,9 @@ urlpatterns = [
         name="playlist_id",
     ),
     path("search/", login_required(SearchView.as_view()), name="search"),
+    path(
+        "cache/videos/<path:thumb_path>",
+        login_required(thumb_miss),
+        name="thumb_miss",
+    ),
 ]
@@ -5,15 +5,17 @@ Functionality:
 """
 
 import json
+import os
 import urllib.parse
 from time import sleep
 
 from django import forms
 from django.contrib.auth import login
 from django.contrib.auth.forms import AuthenticationForm
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.views import View
+from home.src.download.thumbnails import ThumbManager
 from home.src.es.index_setup import get_available_backups
 from home.src.frontend.api_calls import PostData
 from home.src.frontend.forms import (
@@ -32,7 +34,12 @@ from home.src.index.playlist import YoutubePlaylist
 from home.src.ta.config import AppConfig, ScheduleBuilder
 from home.src.ta.helper import UrlListParser
 from home.src.ta.ta_redis import RedisArchivist
-from home.tasks import extrac_dl, subscribe_to
+from home.tasks import (
+    extrac_dl,
+    fetch_missing_thumbs,
+    migrate_thumb_layout,
+    subscribe_to,
+)
 from rest_framework.authtoken.models import Token
 
 
@@ -770,6 +777,8 @@ class SettingsView(View):
             if "application-settings" in form_post:
                 del form_post["application-settings"]
                 config_handler.update_config(form_post)
+                if form_post.get("application_thumb_layout", [""])[0]:
+                    migrate_thumb_layout.delay()
             elif "user-settings" in form_post:
                 del form_post["user-settings"]
                 config_handler.set_user_config(form_post, request.user.id)
@@ -792,6 +801,24 @@ def progress(request):
     return JsonResponse(json_data)
 
 
+def thumb_miss(request, thumb_path):
+    # pylint: disable=unused-argument
+    """resolves to /cache/videos/<thumb_path>
+    nginx fallback if thumbnail is missing in cache,
+    queue download and respond with placeholder
+    """
+    thumb_handler = ThumbManager()
+    file_name = os.path.split(thumb_path)[-1]
+    if thumb_handler.request_missing(file_name):
+        # short delay to batch requests of the same page
+        fetch_missing_thumbs.apply_async(countdown=thumb_handler.MISSING_BATCH)
+
+    placeholder = thumb_handler.get_default_img("video")
+    response = FileResponse(open(placeholder, "rb"), content_type="image/jpeg")
+    response["Cache-Control"] = "no-store"
+    return response
+
+
 def process(request):
     """handle all the buttons calls via POST ajax"""
     if request.method == "POST":
@@ -3,6 +3,9 @@
  * 
  */
 
+// single server push stream per tab
+var progressSource = null;
+
 checkMessages()
 
 // page map to notification status
@@ -19,10 +22,35 @@ function checkMessages() {
     var notifications = document.getElementById("notifications");
     if (notifications) {
         var dataOrigin = notifications.getAttribute("data");
-        getMessages(dataOrigin);
+        if (window.EventSource) {
+            streamMessages(dataOrigin);
+        } else {
+            getMessages(dataOrigin);
+        };
     }
 }
 
+// get messages pushed from server, fall back to polling on failure
+function streamMessages(dataOrigin) {
+    if (progressSource && progressSource.readyState !== EventSource.CLOSED) {
+        // already streaming
+        return;
+    };
+    var received = false;
+    var source = new EventSource('/progress/stream/');
+    progressSource = source;
+    source.onmessage = function(event) {
+        received = true;
+        buildMessage(JSON.parse(event.data), dataOrigin);
+    };
+    source.onerror = function() {
+        if (!received) {
+            source.close();
+            getMessages(dataOrigin);
+        };
+    };
+}
+
 // get messages for page on timer
 function getMessages(dataOrigin) {
     fetch('/progress/').then(response => {
@@ -235,6 +235,17 @@ function reEmbed() {
     toReplace.appendChild(message);
 }
 
+function thumbVariants() {
+    var payload = JSON.stringify({'thumb-variants': true});
+    sendPost(payload);
+    // clear button
+    var message = document.createElement('p');
+    message.innerText = 'optimizing thumbnails';
+    var toReplace = document.getElementById('thumb-variants');
+    toReplace.innerHTML = '';
+    toReplace.appendChild(message);
+}
+
 function dbBackup() {
     var payload = JSON.stringify({'db-backup': true});
     sendPost(payload);